@@ -0,0 +1,296 @@
+from const import *
+from i18n import _
+from config import get_config, get_recent_games
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from functools import partial
+import json
+import os
+import pathlib
+import subprocess
+import time
+import xml.etree.ElementTree as ET
+import zipfile
+
+def get_priority_games(config):
+	"""
+	Get the names of the games to check first when building the games list:
+	the favorites, then the recently launched games.
+
+	:param config: The configuration variables
+	"""
+	try:
+		with open(config["favorites_file"], "r") as f:
+			favorites = list(json.load(f).keys())
+	except (FileNotFoundError, json.JSONDecodeError):
+		favorites = []
+	return favorites + get_recent_games(config)
+
+def check_game_works(game, config):
+	"""
+	Checks if a game works by the MAME executable and parsing the output.
+
+	:param game: The name of the game to check
+	:param config: The configuration variables
+	"""
+
+	snap_name = f"{game}.png"
+	command = [config['mame_executable'], "-verifyroms", game]
+	result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+	works = result.stderr == ''
+	return works, game
+
+
+def check_game_description_and_snapshot(game, config, snaps_list):
+	"""
+	Checks the game details by running the MAME executable and parsing the output.
+
+	:param game: The name of the game to check
+	:param config: The configuration variables
+	:param snaps_list: List of available snapshots
+	"""
+
+	snap_name = f"{game}.png"
+	command = [config['mame_executable'], "-lx", game]
+	process = subprocess.Popen(command, stdout=subprocess.PIPE)
+	output, error = process.communicate()
+
+	# The output will be in bytes, convert it to a string
+	xml_string = output.decode()
+
+	root = ET.fromstring(xml_string)
+	description = None
+	for machine in root.findall(f'.//machine[@name="{game}"]'):
+		description = machine.find(FLD_DESCRIPTION).text
+
+	snapshot = snap_name in snaps_list
+	return game, {FLD_DESCRIPTION: description, "snapshot": snapshot}
+
+def check_game(game, config, snaps_list):
+	"""
+	Checks if a game works and, if so, its description and snapshot.
+
+	:param game: The name of the game to check
+	:param config: The configuration variables
+	:param snaps_list: List of available snapshots
+	"""
+
+	works, game = check_game_works(game, config)
+	if not works:
+		return game, None
+	return check_game_description_and_snapshot(game, config, snaps_list)
+
+def check_games(games_list, config, snaps_list, publish, stop=None):
+	"""
+	Checks multiple games using multiple cores, in the order of games_list,
+	and publishes the working ones in batches.
+
+	:param games_list: List of game names to check
+	:param config: The configuration variables
+	:param snaps_list: List of available snapshots
+	:param publish: Function called with a dictionary of working games for every batch
+	:param stop: An optional threading.Event that stops the check when set
+	"""	
+	games = {}
+	batch = {}
+	last_publish = time.monotonic()
+	i = 1
+	n = len(games_list)
+	pending = iter(games_list)
+	max_workers = os.cpu_count() or 1
+
+	with ProcessPoolExecutor(max_workers=max_workers) as executor:
+		# Keep only a few games in flight, so that they are checked in order
+		# and a stop request does not wait for the whole list
+		futures = set()
+		while True:
+			while len(futures) < max_workers * 2 and (stop is None or not stop.is_set()):
+				game = next(pending, None)
+				if game is None:
+					break
+				futures.add(executor.submit(check_game, game, config, snaps_list))
+			if not futures:
+				break
+
+			done, futures = wait(futures, return_when=FIRST_COMPLETED)
+			for future in done:
+				game, result = future.result()
+				if result is not None:
+					games[game] = result
+					batch[game] = result
+				print(_("Checking if the following game works: n.") + " " + str(i) + " / " + str(n) + ", " + game + "...")
+				i += 1
+
+			if batch and time.monotonic() - last_publish >= PUBLISH_INTERVAL:
+				publish(batch)
+				batch = {}
+				last_publish = time.monotonic()
+
+	if batch:
+		publish(batch)
+	return games
+
+def get_machine_facets(machine):
+	"""
+	Get the filterable facets of a machine from its -listxml element.
+
+	:param machine: The machine element of the -listxml output
+	"""
+
+	players = ""
+	control = ""
+	input_element = machine.find("input")
+	if input_element is not None:
+		players = input_element.attrib.get("players", "")
+		control_element = input_element.find("control")
+		if control_element is not None:
+			control = control_element.attrib.get("type", "")
+
+	orientation = ""
+	display = machine.find("display")
+	if display is not None:
+		if display.attrib.get("rotate", "0") in ("90", "270"):
+			orientation = ORIENTATION_VERTICAL
+		else:
+			orientation = ORIENTATION_HORIZONTAL
+
+	return {
+		FLD_YEAR: machine.findtext("year", ""),
+		FLD_MANUFACTURER: machine.findtext("manufacturer", ""),
+		FLD_PLAYERS: players,
+		FLD_ORIENTATION: orientation,
+		FLD_CONTROL: control,
+		FLD_CLONEOF: machine.attrib.get("cloneof", ""),
+	}
+	
+def is_good_machine(machine):
+	"""
+	Check if a -listxml machine element is a game with good emulation.
+
+	:param machine: The machine element of the -listxml output
+	"""
+	driver = machine.find(".//driver")
+	return (
+		machine.attrib.get("isbios", "no") == "no"
+		and driver is not None
+		and driver.attrib["emulation"] == "good"
+	)
+
+def iter_machines(source):
+	"""
+	Parse a -listxml output while it is read, yielding the machine elements
+	and freeing each one after use.
+
+	:param source: A file name or a binary file object with the -listxml output.
+	"""
+	context = ET.iterparse(source, events=("start", "end"))
+	event, root = next(context)
+	for event, element in context:
+		if event == "end" and element.tag == "machine":
+			yield element
+			root.clear()
+
+def build_games(config, custom_xml=None, priority=None, publish=None, stop=None):
+	"""
+	Build the working game list.
+
+	:param config: The configuration variables
+	:param custom_xml: A custom xml file instead of that one returned by mame -listxml.
+	:param priority: Names of the games to check before all the others.
+	:param publish: Function called with a dictionary of working games for every batch.
+	:param stop: An optional threading.Event that stops the build when set.
+	"""
+
+	config = get_config(False)
+
+	print(_("Getting all your roms list..."))
+	if config["low_memory"]:
+		# Never keeps the whole -listxml output or its tree in memory
+		process = None
+		if custom_xml is None:
+			command = [config['mame_executable'], "-listxml"]
+			process = subprocess.Popen(command, stdout=subprocess.PIPE)
+			source = process.stdout
+		else:
+			source = custom_xml
+
+		try:
+			facets = {
+				machine.attrib["name"]: get_machine_facets(machine)
+				for machine in iter_machines(source)
+				if is_good_machine(machine)
+			}
+		except ET.ParseError as e:
+			print(_("Error") + "\n\n" + str(e))
+			return None
+		finally:
+			if process is not None:
+				process.stdout.close()
+				process.wait()
+	else:
+		if custom_xml is None:
+			command = [config['mame_executable'], "-listxml"]
+			process = subprocess.run(
+				command, stdout=subprocess.PIPE, check=False
+			)
+			xml_string = process.stdout.decode()
+		else:
+			with open(custom_xml, "r") as f:
+				xml_string = f.read()
+
+		try:
+			root = ET.fromstring(xml_string)
+		except ET.ParseError as e:
+			print(_("Error") + "\n\n" + str(e))
+
+		machines = root.findall("machine")
+		facets = {
+			machine.attrib["name"]: get_machine_facets(machine)
+			for machine in machines
+			if is_good_machine(machine)
+		}
+	roms = list(facets.keys())
+
+	# Remove empty strings and non existent zip files for romsfrom the list
+	games_list = [ game for game in roms if game and (pathlib.Path(config['rom_path']) / f"{game}.zip").is_file() ]
+
+	# Sort games
+	games_list.sort()
+
+	# Check the priority games first
+	if priority:
+		available = set(games_list)
+		first = [game for game in dict.fromkeys(priority) if game in available]
+		first_set = set(first)
+		games_list = first + [game for game in games_list if game not in first_set]
+
+	snaps_list = []
+	with zipfile.ZipFile(config["snap_file"], "r") as snaps:
+		snaps_list = snaps.namelist()
+
+	def publish_with_facets(batch):
+		# Keep the facets from the -listxml pass for filtering
+		for game in batch:
+			batch[game].update(facets[game])
+		if publish is not None:
+			publish(batch)
+
+	# Keep only working games
+	games = check_games(games_list, config, snaps_list, publish_with_facets, stop)
+	if stop is not None and stop.is_set():
+		return None
+
+	# Save the games sorted, whatever the order in which they were checked
+	games = {game: games[game] for game in sorted(games)}
+		
+	print(_("Saving everything in") + " " + config["games_file"])
+	with open(config["games_file"], "w") as f:
+		json.dump(games, f, indent=4)
+
+	if config["thumbnail_heights"]:
+		# Pillow is only needed to build the thumbnails
+		from thumbnails import build_thumbnails
+
+		print(_("Saving the thumbnails in") + " " + config["thumbnails_file"])
+		build_thumbnails(games, config)
+
+	return games
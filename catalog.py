@@ -0,0 +1,377 @@
+from const import FLD_DESCRIPTION, FLD_YEAR, FLD_MANUFACTURER, FLD_PLAYERS, FLD_ORIENTATION, FLD_CONTROL, FLD_CLONEOF, FACET_PARENT_CLONE, VAL_PARENT, VAL_CLONE
+
+from config import load_games_file
+from array import array
+from bisect import bisect_right, insort
+import json
+import mmap
+import os
+
+FACETS = (FLD_YEAR, FLD_MANUFACTURER, FLD_PLAYERS, FLD_ORIENTATION, FLD_CONTROL, FACET_PARENT_CLONE)
+
+# Columns of the games catalog after the name, FACET_PARENT_CLONE comes from FLD_CLONEOF.
+# The first ones are enough to list the games, the others are read only by the filters
+CATALOG_FIELDS = (FLD_DESCRIPTION, FLD_CLONEOF, FLD_YEAR, FLD_MANUFACTURER, FLD_PLAYERS, FLD_ORIENTATION, FLD_CONTROL)
+
+# Values matching less than one game every SPARSE_RATIO are kept as sorted
+# position arrays instead of bitsets, which would take size / 8 bytes each
+SPARSE_RATIO = 32
+
+def get_facet_value(game, facet):
+	"""
+	Get the value of a facet for a game, or an empty string if unknown.
+
+	:param game: The game dictionary from the games file.
+	:param facet: The facet name.
+	"""
+	if facet == FACET_PARENT_CLONE:
+		return VAL_CLONE if game.get(FLD_CLONEOF) else VAL_PARENT
+	return game.get(facet, "")
+
+def to_bitset(positions, size):
+	"""
+	Build a bitset (an int) with the bits at the given positions set.
+
+	:param positions: The positions of the bits to set.
+	:param size: The total number of bits.
+	"""
+	bits = bytearray((size + 7) // 8)
+	for position in positions:
+		bits[position >> 3] |= 1 << (position & 7)
+	return int.from_bytes(bits, "little")
+
+def from_bitset(bitset):
+	"""
+	Get the sorted list of the positions of the bits set in a bitset.
+
+	:param bitset: The bitset.
+	"""
+	return [position for position, bit in enumerate(bin(bitset)[:1:-1]) if bit == "1"]
+
+def load_favorites(config, low_memory=False):
+	"""
+	Load the favorites games, or an empty dictionary if there are none yet.
+
+	:param config: The configuration variables
+	:param low_memory: If True, share the repeated strings between the games.
+	"""
+	try:
+		return load_games_file(config["favorites_file"], low_memory)
+	except FileNotFoundError:
+		return {}
+
+def write_games_index(games, path):
+	"""
+	Write the games index: a line "name<TAB>JSON" for every game, sorted by name.
+
+	:param games: The games dictionary.
+	:param path: The path of the index file.
+	"""
+	temporary_file = str(path) + ".tmp"
+	with open(temporary_file, "wb") as f:
+		for game in sorted(games, key=lambda x: x.encode("utf-8")):
+			f.write(game.encode("utf-8") + b"\t" + json.dumps(games[game]).encode("utf-8") + b"\n")
+	os.replace(temporary_file, path)
+
+def write_games_catalog(games, path):
+	"""
+	Write the games catalog: a line "name<TAB>CATALOG_FIELDS..." for every game,
+	sorted by description as in FacetIndex.
+
+	:param games: The games dictionary.
+	:param path: The path of the catalog file.
+	"""
+	temporary_file = str(path) + ".tmp"
+	with open(temporary_file, "w", encoding="utf-8", newline="") as f:
+		for game in sorted(games.keys(), key=lambda x: games[x][FLD_DESCRIPTION]):
+			fields = [game] + [str(games[game].get(field, "")) for field in CATALOG_FIELDS]
+			f.write("\t".join(field.replace("\t", " ").replace("\n", " ") for field in fields) + "\n")
+	os.replace(temporary_file, path)
+
+def update_games_files(config):
+	"""
+	Write the games index and the games catalog again if they are older than the games file.
+
+	:param config: The configuration variables
+	"""
+	games_time = os.path.getmtime(config["games_file"])
+	stale = [
+		path
+		for path in (config["games_index_file"], config["games_catalog_file"])
+		if not os.path.isfile(path) or os.path.getmtime(path) < games_time
+	]
+	if not stale:
+		return
+	games = load_games_file(config["games_file"])
+	if config["games_index_file"] in stale:
+		write_games_index(games, config["games_index_file"])
+	if config["games_catalog_file"] in stale:
+		write_games_catalog(games, config["games_catalog_file"])
+
+def find_game(config, game):
+	"""
+	Find a game by name with a binary search in the games index, without loading
+	the games file. The index is written again when older than the games file.
+
+	:param config: The configuration variables
+	:param game: The name of the game.
+	"""
+	update_games_files(config)
+	index_file = config["games_index_file"]
+	if os.path.getsize(index_file) == 0:
+		return None
+
+	name = game.encode("utf-8")
+	with open(index_file, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as index:
+		# start is always the beginning of a line
+		start = 0
+		end = len(index)
+		while start < end:
+			middle = (start + end) // 2
+			line_start = index.rfind(b"\n", start, middle) + 1 or start
+			line_end = index.find(b"\n", line_start) + 1
+			line_name, _separator, data = index[line_start:line_end].partition(b"\t")
+			if line_name == name:
+				return json.loads(data)
+			if line_name < name:
+				start = line_end
+			else:
+				end = line_start
+	return None
+
+def scan_games(config, text="", filters=None, grouped=False):
+	"""
+	Get the (name, description) of the games, sorted by description, matching the
+	text and the filters, as FacetIndex.query does, scanning the games catalog
+	instead of loading the games file. The catalog is written again when older
+	than the games file.
+
+	:param config: The configuration variables
+	:param text: The text that the description must contain (case insensitive).
+	:param filters: A dictionary facet -> value; empty values are ignored.
+	:param grouped: If True, leave out the clones whose parent is in the list.
+	"""
+	update_games_files(config)
+	with open(config["games_catalog_file"], "r", encoding="utf-8", newline="") as f:
+		lines = f.read().split("\n")[:-1]
+
+	# Only the lines containing the text and the values are split
+	filters = {facet: value for facet, value in (filters or {}).items() if value}
+	if text:
+		text = text.lower()
+		lines = [line for line in lines if text in line.lower()]
+	for facet, value in filters.items():
+		if facet != FACET_PARENT_CLONE:
+			lines = [line for line in lines if value in line]
+
+	# Name, description, clone of and the other columns
+	rows = [line.split("\t", 3) for line in lines]
+	if text:
+		rows = [row for row in rows if text in row[1].lower()]
+
+	for facet, value in filters.items():
+		if facet == FACET_PARENT_CLONE:
+			rows = [row for row in rows if get_facet_value({FLD_CLONEOF: row[2]}, facet) == value]
+		else:
+			column = CATALOG_FIELDS.index(facet) - 2
+			rows = [row for row in rows if row[3].split("\t")[column] == value]
+
+	# The matching clones stay under their parent, unless the parent does not match
+	if grouped:
+		matched = {row[0] for row in rows}
+		rows = [row for row in rows if row[2] not in matched]
+	return [(row[0], row[1]) for row in rows]
+
+def save_favorites(config, favorites):
+	"""
+	Save the favorites games.
+
+	:param config: The configuration variables
+	:param favorites: The favorites games dictionary.
+	"""
+	with open(config["favorites_file"], "w") as f:
+		json.dump(favorites, f)
+
+class FacetIndex:
+	"""
+	Class that keeps precomputed per-facet bitsets over a games dictionary,
+	so that filters are combined by intersection instead of rescanning every game.
+	"""
+
+	def __init__(self, games, low_memory=False):
+		"""
+		Initialize the FacetIndex class.
+
+		:param games: The games dictionary from the games file.
+		:param low_memory: If True, do not keep the lowercase descriptions for the search.
+		"""
+		# Games sorted by description: bit i refers to self.names[i]
+		self.names = sorted(games.keys(), key=lambda x: games[x][FLD_DESCRIPTION])
+		self.descriptions = [games[game][FLD_DESCRIPTION] for game in self.names]
+		self.folded = None if low_memory else [description.lower() for description in self.descriptions]
+		self.all = (1 << len(self.names)) - 1
+
+		# Built on first use of a filter
+		self.games = games
+		self.bitsets = None
+		# Built on first use of the filter values
+		self.facet_values = None
+		# Built on first use of the grouped mode: the clones of the games in the list,
+		# sorted by description, the clones whose parent is not in the list yet
+		# and the bitset of the games that are not hidden under their parent
+		self.clones = None
+		self.orphans = None
+		self.parents = None
+
+	def add(self, games):
+		"""
+		Add games to the index, keeping the names sorted by description. The
+		bitsets are built again on the next use of a filter.
+
+		:param games: The dictionary of the games to add, already in self.games.
+		"""
+		key = lambda x: self.games[x][FLD_DESCRIPTION]
+		for game in sorted(games.keys(), key=key):
+			description = self.games[game][FLD_DESCRIPTION]
+			position = bisect_right(self.descriptions, description)
+			self.names.insert(position, game)
+			self.descriptions.insert(position, description)
+			if self.folded is not None:
+				self.folded.insert(position, description.lower())
+			if self.facet_values is not None:
+				for facet in FACETS:
+					self.facet_values[facet].add(get_facet_value(self.games[game], facet))
+
+			if self.clones is not None:
+				parent = self.games[game].get(FLD_CLONEOF, "")
+				if parent in self.games:
+					insort(self.clones.setdefault(parent, []), game, key=key)
+				elif parent:
+					self.orphans.setdefault(parent, []).append(game)
+				# Its clones listed before it
+				for clone in self.orphans.pop(game, []):
+					insort(self.clones.setdefault(game, []), clone, key=key)
+
+		self.all = (1 << len(self.names)) - 1
+		self.bitsets = None
+		self.parents = None
+
+	def get_clone_lists(self):
+		"""
+		Get the dictionary parent -> clones sorted by description, building it on first use.
+		"""
+		if self.clones is None:
+			self.clones = {}
+			self.orphans = {}
+			for game in self.names:
+				parent = self.games[game].get(FLD_CLONEOF, "")
+				if parent in self.games:
+					self.clones.setdefault(parent, []).append(game)
+				elif parent:
+					self.orphans.setdefault(parent, []).append(game)
+		return self.clones
+
+	def get_parents(self):
+		"""
+		Get the bitset of the games that are not hidden under their parent in grouped mode.
+		"""
+		if self.parents is None:
+			clones = self.get_clone_lists()
+			hidden = [
+				position
+				for position, game in enumerate(self.names)
+				if self.games[game].get(FLD_CLONEOF, "") in clones
+			]
+			self.parents = self.all & ~to_bitset(hidden, len(self.names))
+		return self.parents
+
+	def get_bitsets(self, facet):
+		"""
+		Get the bitsets of every value of a facet, building them on first use.
+
+		:param facet: The facet name.
+		"""
+		if self.bitsets is None:
+			self.bitsets = {}
+		if facet in self.bitsets:
+			return self.bitsets[facet]
+
+		positions = {}
+		for position, game in enumerate(self.names):
+			value = get_facet_value(self.games[game], facet)
+			if value:
+				positions.setdefault(value, []).append(position)
+		self.bitsets[facet] = {
+			value: (
+				array("I", value_positions)
+				if len(value_positions) * SPARSE_RATIO < len(self.names)
+				else to_bitset(value_positions, len(self.names))
+			)
+			for value, value_positions in positions.items()
+		}
+		return self.bitsets[facet]
+
+	def values(self, facet):
+		"""
+		Get the sorted list of the known values of a facet.
+
+		:param facet: The facet name.
+		"""
+		if self.facet_values is None:
+			self.facet_values = {name: set() for name in FACETS}
+			for game in self.names:
+				for name in FACETS:
+					self.facet_values[name].add(get_facet_value(self.games[game], name))
+		return sorted(value for value in self.facet_values[facet] if value)
+
+	def get_clones(self, game, text="", filters=None):
+		"""
+		Get the names of the clones of a game matching the text and the filters, sorted by description.
+
+		:param game: The name of the parent game.
+		:param text: The text that the description must contain (case insensitive).
+		:param filters: A dictionary facet -> value; empty values are ignored.
+		"""
+		clones = self.get_clone_lists().get(game, [])
+		if text:
+			text = text.lower()
+			clones = [clone for clone in clones if text in self.games[clone][FLD_DESCRIPTION].lower()]
+		for facet, value in (filters or {}).items():
+			if value:
+				clones = [clone for clone in clones if get_facet_value(self.games[clone], facet) == value]
+		return clones
+
+	def query(self, text="", filters=None, grouped=False):
+		"""
+		Get the names of the games, sorted by description, matching the text and the filters.
+
+		:param text: The text that the description must contain (case insensitive).
+		:param filters: A dictionary facet -> value; empty values are ignored.
+		:param grouped: If True, leave out the clones whose parent is in the list.
+		"""
+		bitset = self.all
+		for facet, value in (filters or {}).items():
+			if value:
+				value_bitset = self.get_bitsets(facet).get(value, 0)
+				if isinstance(value_bitset, array):
+					value_bitset = to_bitset(value_bitset, len(self.names))
+				bitset &= value_bitset
+
+		# Without text and filters only the parents are listed
+		if grouped and not text and bitset == self.all:
+			return [self.names[position] for position in from_bitset(self.get_parents())]
+
+		positions = range(len(self.names)) if bitset == self.all else from_bitset(bitset)
+		if text:
+			text = text.lower()
+			if self.folded is None:
+				positions = [position for position in positions if text in self.descriptions[position].lower()]
+			else:
+				positions = [position for position in positions if text in self.folded[position]]
+		names = [self.names[position] for position in positions]
+
+		# The matching clones stay under their parent, unless the parent does not match
+		if grouped:
+			matched = set(names)
+			names = [name for name in names if self.games[name].get(FLD_CLONEOF, "") not in matched]
+		return names
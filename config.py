@@ -1,16 +1,12 @@
 from const import *
 from i18n import _
 import configparser
-from concurrent.futures import ProcessPoolExecutor, as_completed
-from functools import partial
 import json
 import os
 import pathlib
 import shutil
-import subprocess
-import xml.etree.ElementTree as ET
+import sys
 from platformdirs import user_config_dir
-import zipfile
 
 def get_config(read_from_config_dir=False):
 	"""
@@ -23,7 +19,14 @@ def get_config(read_from_config_dir=False):
 	app_name = "e4mame"
 	config_file = "config.ini"
 	games_file = "games.json"
+	games_index_file = "games.idx"
+	games_catalog_file = "games.tsv"
 	favorites_file = "favorites.json"
+	thumbnails_file = "thumbnails.zip"
+	recent_file = "recent.json"
+	stall_log_file = "stalls.log"
+	launches_file = "launches.bin"
+	mame_version_file = "mame_version.json"
 	config_dir = user_config_dir(app_name)
 	config_dir_path = pathlib.Path(config_dir)
 
@@ -32,14 +35,33 @@ def get_config(read_from_config_dir=False):
 	rom_path = config["global"]["rom_path"]
 	snap_file = config["global"]["snap_file"]
 	mame_executable = config["global"]["mame_executable"]
+	group_clones = config["global"].getboolean("group_clones", fallback=False)
+	low_memory = config["global"].getboolean("low_memory", fallback=False)
+	stall_threshold = config["global"].getint("stall_threshold", fallback=0)
+	thumbnail_heights = [
+		int(height)
+		for height in config["global"].get("thumbnail_heights", fallback="").split(",")
+		if height.strip()
+	]
 
 	config = {"config_file": config_file, 
 		"games_file": (config_dir_path / games_file) if read_from_config_dir else games_file,
+		"games_index_file": (config_dir_path / games_index_file) if read_from_config_dir else games_index_file,
+		"games_catalog_file": (config_dir_path / games_catalog_file) if read_from_config_dir else games_catalog_file,
 		"favorites_file": (config_dir_path / favorites_file) if read_from_config_dir else favorites_file,
+		"thumbnails_file": (config_dir_path / thumbnails_file) if read_from_config_dir else thumbnails_file,
+		"recent_file": config_dir_path / recent_file,
+		"stall_log_file": config_dir_path / stall_log_file,
+		"launches_file": config_dir_path / launches_file,
+		"mame_version_file": config_dir_path / mame_version_file,
 		"config_dir": config_dir,
 		"rom_path": rom_path,
 		"snap_file": snap_file,
 		"mame_executable": mame_executable,
+		"group_clones": group_clones,
+		"thumbnail_heights": thumbnail_heights,
+		"stall_threshold": stall_threshold,
+		"low_memory": low_memory,
 	}
 	return config
 
@@ -49,153 +71,58 @@ def copy_config_files():
 	"""
 
 	config = get_config(False)
-	# Copy the config file
-	if not os.path.isdir(config["config_dir"]):
-		# Create the directory
-		os.makedirs(config["config_dir"], exist_ok=True)
-		shutil.copy(config["config_file"], config["config_dir"])
-		shutil.copy(config["games_file"], config["config_dir"])
-
-def check_game_works(game, config):
+	# Create the directory
+	os.makedirs(config["config_dir"], exist_ok=True)
+	# Copy the config file if it is not there yet, the built files if they are newer
+	for file, refresh in ((config["config_file"], False), (config["games_file"], True), (config["thumbnails_file"], True)):
+		destination = os.path.join(config["config_dir"], os.path.basename(file))
+		if not os.path.isfile(file):
+			continue
+		if not os.path.isfile(destination) or (refresh and os.path.getmtime(file) > os.path.getmtime(destination)):
+			shutil.copy(file, destination)
+
+def intern_strings(pairs):
 	"""
-	Checks if a game works by the MAME executable and parsing the output.
+	JSON object hook that shares the repeated keys and strings of the games file.
 
-	:param game: The name of the game to check
-	:param config: The configuration variables
+	:param pairs: The key / value pairs of a JSON object.
 	"""
+	return {
+		sys.intern(key): sys.intern(value) if isinstance(value, str) else value
+		for key, value in pairs
+	}
 
-	snap_name = f"{game}.png"
-	command = [config['mame_executable'], "-verifyroms", game]
-	result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-	works = result.stderr == ''
-	return works, game
-
-
-def check_games_work(games_list, config):
-	"""
-	Checks multiple games for functionality using multiple cores.
-
-	:param games_list: List of game names to check
-	:param config: The configuration variables
-	:param snaps_list: List of available snapshots
-	"""	
-	games = []
-	i = 1
-	n = len(games_list)
-
-	with ProcessPoolExecutor() as executor:
-		futures = {executor.submit(check_game_works, game, config): game for game in games_list}
-
-		for future in as_completed(futures):
-			works, game = future.result()
-			if works:
-				games.append(game)
-			print(_("Checking if the following game works: n.") + " " + str(i) + " / " + str(n) + ", " + game + "...")
-			i += 1
-
-	return games
-
-def check_game_description_and_snapshot(game, config, snaps_list):
+def load_games_file(path, low_memory=False):
 	"""
-	Checks the game details by running the MAME executable and parsing the output.
+	Load a games dictionary from a JSON file.
 
-	:param game: The name of the game to check
-	:param config: The configuration variables
-	:param snaps_list: List of available snapshots
+	:param path: The path of the JSON file.
+	:param low_memory: If True, share the repeated strings between the games.
 	"""
+	with open(path, "r") as f:
+		if low_memory:
+			return json.load(f, object_pairs_hook=intern_strings)
+		return json.load(f)
 
-	snap_name = f"{game}.png"
-	command = [config['mame_executable'], "-lx", game]
-	process = subprocess.Popen(command, stdout=subprocess.PIPE)
-	output, error = process.communicate()
-
-	# The output will be in bytes, convert it to a string
-	xml_string = output.decode()
-
-	root = ET.fromstring(xml_string)
-	description = None
-	for machine in root.findall(f'.//machine[@name="{game}"]'):
-		description = machine.find(FLD_DESCRIPTION).text
-
-	snapshot = snap_name in snaps_list
-	return game, {FLD_DESCRIPTION: description, "snapshot": snapshot}
-
-def check_games_descriptions_and_snapshopts(games_list, config, snaps_list):
+def get_recent_games(config):
 	"""
-	Checks multiple games for their descriptions and snapshots.
+	Get the names of the recently launched games, the most recent first.
 
-	:param games_list: List of game names to check
 	:param config: The configuration variables
-	:param snaps_list: List of available snapshots
-	"""	
-	games = {}
-	i = 1
-	n = len(games_list)
-
-	with ProcessPoolExecutor() as executor:
-		futures = {executor.submit(check_game_description_and_snapshot, game, config, snaps_list): game for game in games_list}
-
-		for future in as_completed(futures):
-			game, result = future.result()
-			games[game] = result
-			print(_("Getting the description and checking the snapshot for the following game: n.") + " " + str(i) + " / " + str(n) + ", " + game + "...")
-			i += 1
+	"""
+	try:
+		with open(config["recent_file"], "r") as f:
+			return json.load(f)
+	except (FileNotFoundError, json.JSONDecodeError):
+		return []
 
-	return games	
-	
-def build_games(config, custom_xml=None):
+def add_recent_game(config, game):
 	"""
-	Build the working game list.
+	Add a game at the top of the recently launched games.
 
 	:param config: The configuration variables
-	:param custom_xml: A custom xml file instead of that one returned by mame -listxml.
+	:param game: The name of the game
 	"""
-
-	config = get_config(False)
-
-	print(_("Getting all your roms list..."))
-	if custom_xml is None:
-		command = [config['mame_executable'], "-listxml"]
-		process = subprocess.run(
-			command, stdout=subprocess.PIPE, check=False
-		)
-		xml_string = process.stdout.decode()
-	else:
-		with open(custom_xml, "r") as f:
-			xml_string = f.read()
-
-	try:
-		root = ET.fromstring(xml_string)
-	except ET.ParseError as e:
-		print(_("Error") + "\n\n" + str(e))
-
-	machines = root.findall("machine")
-	roms = [
-		machine.attrib["name"]
-		for machine in machines
-		if machine.attrib["isbios"] == "no"
-		and machine.find(".//driver") is not None
-		and machine.find(".//driver").attrib["emulation"] == "good"
-	]
-
-	# Remove empty strings and non existent zip files for romsfrom the list
-	games_list = [ game for game in roms if game and (pathlib.Path(config['rom_path']) / f"{game}.zip").is_file() ]
-
-	# Sort games
-	games_list.sort()
-
-	# Keep only working games
-	games_list = check_games_work(games_list, config)
-	
-	games = {}
-	n = len(games_list)
-	i = 1
-	snaps_list = []
-	with zipfile.ZipFile(config["snap_file"], "r") as snaps:
-		snaps_list = snaps.namelist()
-
-	games = check_games_descriptions_and_snapshopts(games_list, config, snaps_list)
-		
-	print(_("Saving everything in") + " " + config["games_file"])
-	with open(config["games_file"], "w") as f:
-		json.dump(games, f, indent=4)
+	recent = [game] + [name for name in get_recent_games(config) if name != game]
+	with open(config["recent_file"], "w") as f:
+		json.dump(recent[:RECENT_GAMES], f)
@@ -11,8 +11,46 @@ LBL_SEARCH = _("Type to search")
 LBL_ALL_GAMES = _("All games")
 LBL_FAVORITES = _("Favorites")
 LBL_QUIT = _("Quit")
+LBL_ANY = _("Any")
+LBL_YEAR = _("Year")
+LBL_MANUFACTURER = _("Manufacturer")
+LBL_PLAYERS = _("Players")
+LBL_ORIENTATION = _("Orientation")
+LBL_CONTROL = _("Control")
+LBL_PARENT_CLONE = _("Parent / clone")
+LBL_PARENT = _("Parent")
+LBL_CLONE = _("Clone")
+LBL_SHOW_CLONES = _("Show clones")
+LBL_HIDE_CLONES = _("Hide clones")
 
 FLD_DESCRIPTION = "description"
+FLD_YEAR = "year"
+FLD_MANUFACTURER = "manufacturer"
+FLD_PLAYERS = "players"
+FLD_ORIENTATION = "orientation"
+FLD_CONTROL = "control"
+FLD_CLONEOF = "cloneof"
+
+FACET_PARENT_CLONE = "parent_clone"
+VAL_PARENT = "parent"
+VAL_CLONE = "clone"
+
+# Labels of the facet values that are not shown as they are
+VALUE_LABELS = {VAL_PARENT: LBL_PARENT, VAL_CLONE: LBL_CLONE}
+
+ORIENTATION_HORIZONTAL = "horizontal"
+ORIENTATION_VERTICAL = "vertical"
+
+CLONE_INDENT = "    "
+
+# Seconds between two batches of games published while building the games list
+PUBLISH_INTERVAL = 2
+# Number of recently launched games to remember
+RECENT_GAMES = 50
+# Seconds after which the type-ahead starts a new prefix
+TYPEAHEAD_TIMEOUT = 1
+# Milliseconds without resize events before decoding the snapshot again in low memory mode
+RESIZE_DELAY = 200
 
 ALL_GAMES_FRONTEND = 'all_games_frontend'
 
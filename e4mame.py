@@ -1,12 +1,15 @@
-from config import get_config, copy_config_files, _
-from const import APP_TITLE, MIN_WIDTH, MIN_HEIGHT, LBL_ADD_TO_FAVORITES, LBL_REMOVE_FROM_FAVORITES, LBL_LAUNCH, LBL_SEARCH, LBL_ALL_GAMES, LBL_FAVORITES, LBL_QUIT, FLD_DESCRIPTION, ALL_GAMES_FRONTEND, FAVORITES_GAMES_FRONTEND
+from config import get_config, copy_config_files, load_games_file, _
+from const import APP_TITLE, MIN_WIDTH, MIN_HEIGHT, LBL_ADD_TO_FAVORITES, LBL_REMOVE_FROM_FAVORITES, LBL_LAUNCH, LBL_SEARCH, LBL_ALL_GAMES, LBL_FAVORITES, LBL_QUIT, LBL_ANY, LBL_YEAR, LBL_MANUFACTURER, LBL_PLAYERS, LBL_ORIENTATION, LBL_CONTROL, LBL_PARENT_CLONE, LBL_SHOW_CLONES, LBL_HIDE_CLONES, FLD_DESCRIPTION, FLD_YEAR, FLD_MANUFACTURER, FLD_PLAYERS, FLD_ORIENTATION, FLD_CONTROL, FACET_PARENT_CLONE, VALUE_LABELS, CLONE_INDENT, TYPEAHEAD_TIMEOUT, RESIZE_DELAY, ALL_GAMES_FRONTEND, FAVORITES_GAMES_FRONTEND
+from catalog import FacetIndex, FACETS, load_favorites, save_favorites
+from thumbnails import get_thumbnail_cache
+from launches import run_game
+from bisect import bisect_left, insort
 import io
-import json
 import os
 import subprocess
 import sys
+import time
 import tkinter as tk
-import tkinter.constants as tkconst
 from tkinter import messagebox
 from tkinter import ttk, font
 import zipfile
@@ -44,8 +47,20 @@ class E4Mame:
 			copy_config_files()
 			self.config = get_config(True)
 
+		# Shares the strings and the games between the frontends, keeps the images small
+		self.low_memory = self.config["low_memory"]
+
 		self.favorites = self.load_favorites()
 
+		# Shows only parents, with their clones expanded on request
+		self.grouped = self.config["group_clones"]
+		self.expanded = {}
+
+		# Type-ahead prefix and sorted (case-folded description, game) pairs of the displayed games
+		self.typeahead_prefix = ""
+		self.typeahead_time = 0
+		self.typeahead_keys = []
+
 		# Creates a frame for the game list
 		self.game_list_frame = tk.Frame(self.window)
 		self.game_list_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
@@ -77,6 +92,8 @@ class E4Mame:
 		self.menu.add_command(
 			label=LBL_REMOVE_FROM_FAVORITES, command=self.remove_favorite
 		)
+		if self.grouped:
+			self.menu.add_command(label=LBL_SHOW_CLONES, command=self.toggle_clones)
 		self.menu.add_separator()
 		self.menu.add_command(label=LBL_QUIT, command=self.window.quit)
 		self.game_list.bind("<Button-3>", self.popup)
@@ -122,14 +139,41 @@ class E4Mame:
 			self.games = {}
 		else:
 			# Loads the JSON file with game information
-			with open(self.source, "r") as f:
-				self.games = json.load(f)
+			self.games = self.share_games(load_games_file(self.source, self.low_memory))
+
+		# Precomputes the facet indexes
+		self.index = FacetIndex(self.games, self.low_memory)
+		self.displayed_games = []
+		# Displayed game -> row in the games list
+		self.displayed_rows = {}
+
+		# Creates the filters (if search is True)
+		if self.search:
+			self.filter_frame = tk.Frame(self.game_list_frame)
+			self.filter_frame.pack(side=tk.TOP, fill=tk.X, padx=(self.pad, self.pad), pady=(0, self.pad))
+			self.filter_vars = {}
+			self.filter_comboboxes = {}
+			facet_labels = {
+				FLD_YEAR: LBL_YEAR,
+				FLD_MANUFACTURER: LBL_MANUFACTURER,
+				FLD_PLAYERS: LBL_PLAYERS,
+				FLD_ORIENTATION: LBL_ORIENTATION,
+				FLD_CONTROL: LBL_CONTROL,
+				FACET_PARENT_CLONE: LBL_PARENT_CLONE,
+			}
+			for column, facet in enumerate(FACETS):
+				tk.Label(self.filter_frame, text=facet_labels[facet]).grid(row=0, column=column, sticky=tk.W)
+				self.filter_vars[facet] = tk.StringVar(value=LBL_ANY)
+				self.filter_comboboxes[facet] = ttk.Combobox(
+					self.filter_frame, textvariable=self.filter_vars[facet], state="readonly", width=12
+				)
+				self.filter_comboboxes[facet].grid(row=1, column=column, sticky=tk.EW)
+				self.filter_comboboxes[facet].bind("<<ComboboxSelected>>", self.search_games)
+				self.filter_frame.columnconfigure(column, weight=1)
+			self.update_filters()
 
 		# Adds games to the list
-		for game in sorted(
-			self.games.keys(), key=lambda x: self.games[x][FLD_DESCRIPTION]
-		):
-			self.game_list.insert(tk.END, self.games[game][FLD_DESCRIPTION])
+		self.show_games(self.index.query(grouped=self.grouped))
 
 		# Creates a frame for the game image
 		self.game_image_frame = ttk.Frame(self.window)
@@ -148,6 +192,13 @@ class E4Mame:
 		self.game_image = None
 		self.game_image_tk = None
 
+		# Pre-scaled snapshots (if thumbnail_heights is set)
+		self.thumbnails = get_thumbnail_cache(self.config) if self.config["thumbnail_heights"] else None
+		self.thumbnail_height = None
+		self.selected_game = None
+		self.image_height = None
+		self.resize_job = None
+
 		# Updates the game description and image at startup
 		self.on_game_select(None)
 
@@ -156,23 +207,35 @@ class E4Mame:
 		Load the favorites games from the JSON file.
 		"""
 		try:
-			with open(self.config["favorites_file"], "r") as f:
-				favorites = json.load(f)
-		except FileNotFoundError:
-			favorites = {}
+			favorites = self.share_games(load_favorites(self.config, self.low_memory))
 		except (PermissionError, IsADirectoryError) as e:
 			self.error(e, True)
 			favorites = {}
 		return favorites
 
+	def share_games(self, games):
+		"""
+		In low memory mode, replace the games with the same ones of the all games frontend.
+
+		:param games: The games dictionary.
+		"""
+		if not self.low_memory or self.manager is None:
+			return games
+		all_games_frontend = self.manager.get_instance(ALL_GAMES_FRONTEND)
+		if all_games_frontend is None or all_games_frontend is self:
+			return games
+		for game in games:
+			if game in all_games_frontend.games:
+				games[game] = all_games_frontend.games[game]
+		return games
+
 	def save_favorites(self):
 		"""
 		Save the favorites games to the JSON file.
 		"""
 		
 		# Saves the favorites
-		with open(self.config["favorites_file"], "w") as f:
-			json.dump(self.favorites, f)
+		save_favorites(self.config, self.favorites)
 
 		self.favorites = self.load_favorites()
 
@@ -219,41 +282,170 @@ class E4Mame:
 
 	def on_key_press(self, letter):
 		"""
-		Handle the key press event in the games list.
+		Handle the key press event in the games list: the letters typed within
+		TYPEAHEAD_TIMEOUT seconds select the first game starting with them.
 
 		:param letter: The letter that was pressed.
 		"""
-		if letter.isalpha():
-			for idx, game_name in enumerate(self.game_list.get(0, tkconst.END)):
-				if game_name.lower().startswith(letter.lower()):
-					self.game_list.see(idx)
-					self.game_list.selection_clear(0, tk.END)
-					self.game_list.selection_set(idx)
-					self.on_game_select(None)
-					break
-		elif letter in ("\r", "\n"):
+		if letter in ("\r", "\n"):
 			self.launch_game()
+			return
+
+		now = time.monotonic()
+		if now - self.typeahead_time > TYPEAHEAD_TIMEOUT:
+			self.typeahead_prefix = ""
+		self.typeahead_time = now
+
+		if letter == "\b":
+			self.typeahead_prefix = self.typeahead_prefix[:-1]
+		elif letter.isprintable() and letter != "" and (self.typeahead_prefix or not letter.isspace()):
+			self.typeahead_prefix += letter
+		else:
+			return
+		if not self.typeahead_prefix:
+			return
+
+		idx = self.find_prefix(self.typeahead_prefix)
+		if idx is not None:
+			self.game_list.see(idx)
+			self.game_list.selection_clear(0, tk.END)
+			self.game_list.selection_set(idx)
+			self.game_list.activate(idx)
+			self.on_game_select(None)
+
+	def find_prefix(self, prefix):
+		"""
+		Find the row of the first displayed game whose description starts with a prefix, or None.
+
+		:param prefix: The prefix, case insensitive.
+		"""
+		prefix = prefix.casefold()
+		position = bisect_left(self.typeahead_keys, (prefix,))
+		if position < len(self.typeahead_keys) and self.typeahead_keys[position][0].startswith(prefix):
+			return self.displayed_rows[self.typeahead_keys[position][1]]
+		return None
+
+	def get_typeahead_key(self, game):
+		"""
+		Get the type-ahead key of a game.
+
+		:param game: The name of the game.
+		"""
+		return self.games[game][FLD_DESCRIPTION].casefold(), game
+
+	def add_typeahead_keys(self, games):
+		"""
+		Add the type-ahead keys of games being displayed.
+
+		:param games: The names of the games.
+		"""
+		for game in games:
+			insort(self.typeahead_keys, self.get_typeahead_key(game))
+
+	def remove_typeahead_keys(self, games):
+		"""
+		Remove the type-ahead keys of games not displayed anymore.
+
+		:param games: The names of the games.
+		"""
+		for game in games:
+			del self.typeahead_keys[bisect_left(self.typeahead_keys, self.get_typeahead_key(game))]
+
+	def update_rows(self):
+		"""
+		Update the rows of the displayed games after a change of the games list.
+		"""
+		self.displayed_rows = {game: row for row, game in enumerate(self.displayed_games)}
 
 	def search_games(self, *args):
 		"""
-		Search the games list and display the results.
+		Search the games list with the search string and the filters and display the results.
+		"""
+		self.show_games(self.index.query(self.search_var.get(), self.get_filters(), self.grouped))
+
+	def get_query(self):
+		"""
+		Get the search string and the filters of the games list.
+		"""
+		if not self.search:
+			return "", {}
+		return self.search_var.get(), self.get_filters()
+
+	def get_filters(self):
+		"""
+		Get the selected filters as a dictionary facet -> value.
+		"""
+		# The comboboxes show the labels of the values
+		values = {label: value for value, label in VALUE_LABELS.items()}
+		return {
+			facet: values.get(var.get(), var.get())
+			for facet, var in self.filter_vars.items()
+			if var.get() != LBL_ANY
+		}
+
+	def update_filters(self):
+		"""
+		Update the values of the filter comboboxes from the facet indexes.
+		"""
+		for facet, combobox in self.filter_comboboxes.items():
+			labels = [VALUE_LABELS.get(value, value) for value in self.index.values(facet)]
+			combobox.config(values=[LBL_ANY] + labels)
+			if self.filter_vars[facet].get() not in labels:
+				self.filter_vars[facet].set(LBL_ANY)
+
+	def show_games(self, games):
+		"""
+		Display the given games in the games list.
+
+		:param games: The names of the games to display, in display order.
 		"""
-		# Clears the game list
 		self.game_list.delete(0, tk.END)
+		self.displayed_games = games
+		self.expanded = {}
+		# The games are sorted by description, almost the order of the keys
+		self.typeahead_keys = sorted(map(self.get_typeahead_key, games))
+		self.update_rows()
+		if games:
+			self.game_list.insert(tk.END, *[self.games[game][FLD_DESCRIPTION] for game in games])
+
+	def toggle_clones(self, selected_game):
+		"""
+		Show or hide the clones of a game under it in the games list.
+
+		:param selected_game: The name of the parent game.
+		"""
+		if selected_game not in self.displayed_rows:
+			return
+		index = self.displayed_rows[selected_game] + 1
+
+		if selected_game in self.expanded:
+			# Removes the clones rows
+			count = self.expanded.pop(selected_game)
+			self.game_list.delete(index, index + count - 1)
+			self.remove_typeahead_keys(self.displayed_games[index:index + count])
+			del self.displayed_games[index:index + count]
+			self.update_rows()
+			return
+
+		# Only the clones matching the search and the filters
+		clones = self.index.get_clones(selected_game, *self.get_query())
+		if clones:
+			# Materialises the clones rows just after the parent
+			self.expanded[selected_game] = len(clones)
+			self.game_list.insert(index, *[CLONE_INDENT + self.games[clone][FLD_DESCRIPTION] for clone in clones])
+			self.displayed_games[index:index] = clones
+			self.add_typeahead_keys(clones)
+			self.update_rows()
 
-		# Adds games that contain the search string to the list
-		if self.search_var.get():  # If the search string is not empty
-			for game in self.games.keys():
-				if (
-					self.search_var.get().lower()
-					in self.games[game][FLD_DESCRIPTION].lower()
-				):
-					self.game_list.insert(tk.END, self.games[game][FLD_DESCRIPTION])
-		else:  # If the search string is empty
-			for game in sorted(
-				self.games.keys(), key=lambda x: self.games[x][FLD_DESCRIPTION]
-			):
-				self.game_list.insert(tk.END, self.games[game][FLD_DESCRIPTION])
+	def get_game_at(self, index):
+		"""
+		Get the name of the game displayed at the given index of the games list, or None.
+
+		:param index: The index in the games list.
+		"""
+		if 0 <= index < len(self.displayed_games):
+			return self.displayed_games[index]
+		return None
 
 	def select_first_game(self):
 		"""
@@ -284,10 +476,25 @@ class E4Mame:
 		if self.game_image is None:
 			return
 
+		new_height = self.get_image_height()
+
+		# Loads the thumbnail for the new height, if it changes
+		if self.thumbnail_height is not None:
+			if self.thumbnails.get_height(new_height) != self.thumbnail_height:
+				self.load_game_image(self.selected_game)
+			return
+
+		# Decodes the snapshot again for the new height, the original is not kept,
+		# once the window stops being resized
+		if self.low_memory:
+			if self.resize_job is not None:
+				self.window.after_cancel(self.resize_job)
+				self.resize_job = None
+			if new_height != self.image_height:
+				self.resize_job = self.window.after(RESIZE_DELAY, self.on_resize_end)
+			return
+
 		# Resize the game image
-		margin = self.scrollbar.winfo_width() + self.info_frame.winfo_height()
-		window_height = self.window.winfo_height()
-		new_height = window_height - margin
 		ratio = new_height / self.game_image.height
 		new_width = int(self.game_image.width * ratio)
 		if new_width <= 0 or new_height <= 0:
@@ -299,6 +506,38 @@ class E4Mame:
 		self.game_image_label.config(image=self.game_image_tk)
 		self.game_image_label.image = self.game_image_tk
 
+	def on_resize_end(self):
+		"""
+		Load the game image again at the window size, once the window stops being resized.
+		"""
+		self.resize_job = None
+		self.load_game_image(self.selected_game)
+
+	def get_image_height(self):
+		"""
+		Get the height available for the game image.
+		"""
+		margin = self.scrollbar.winfo_width() + self.info_frame.winfo_height()
+		return self.window.winfo_height() - margin
+
+	def reduce_image(self, image, height):
+		"""
+		Decode an image directly at the given height, reducing it before resampling.
+
+		:param image: The PIL image, not loaded yet.
+		:param height: The height of the image to display.
+		"""
+		if height <= 0 or image.height <= height:
+			return image
+
+		# Only JPEG images can be decoded at a smaller size
+		image.draft(image.mode, (image.width * height // image.height, height))
+		factor = image.height // height
+		if factor > 1:
+			image = image.reduce(factor)
+		width = max(1, int(image.width * height / image.height))
+		return image.resize((width, height), Image.LANCZOS)
+
 	def on_game_select(self, event):
 		"""
 		Handle the game select event.
@@ -311,15 +550,10 @@ class E4Mame:
 		if len(self.game_list.curselection()) == 0:
 			return
 
-		# Gets the description of the selected game
-		selected_game_description = self.game_list.selection_get()
-
 		# Finds the name of the selected game
-		selected_game = next(
-			game
-			for game in self.games
-			if self.games[game][FLD_DESCRIPTION] == selected_game_description
-		)
+		selected_game = self.get_game_at(self.game_list.curselection()[0])
+		if selected_game is None:
+			return
 
 		# Updates the image of the selected game
 		self.load_game_image(selected_game)
@@ -330,17 +564,37 @@ class E4Mame:
 
 		:param selected_game: The name of the game.
 		"""
+		self.selected_game = selected_game
+		self.thumbnail_height = None
+
 		# Updates the image of the selected game
 		if self.games[selected_game]["snapshot"]:
+			img_data = None
+
+			# Loads the pre-scaled image of the selected game
+			if self.thumbnails is not None:
+				height = self.get_image_height()
+				try:
+					img_data = self.thumbnails.get(selected_game, height)
+				except (FileNotFoundError, PermissionError, zipfile.BadZipFile):
+					# Falls back to the snapshot
+					img_data = None
+				if img_data is not None:
+					self.thumbnail_height = self.thumbnails.get_height(height)
+
 			# Loads the image of the selected game
-			game_image_name = f"{selected_game}.png"
-			try:
-				with zipfile.ZipFile(self.config["snap_file"], "r") as snaps:
-					img_data = snaps.read(game_image_name)
-			except (FileNotFoundError, PermissionError, zipfile.BadZipFile) as e:
-				self.error(e, True)
+			if img_data is None:
+				game_image_name = f"{selected_game}.png"
+				try:
+					with zipfile.ZipFile(self.config["snap_file"], "r") as snaps:
+						img_data = snaps.read(game_image_name)
+				except (FileNotFoundError, PermissionError, zipfile.BadZipFile) as e:
+					self.error(e, True)
 
 			self.game_image = Image.open(io.BytesIO(img_data))
+			if self.low_memory and self.thumbnail_height is None:
+				self.image_height = self.get_image_height()
+				self.game_image = self.reduce_image(self.game_image, self.image_height)
 
 			# Converts the PIL image to a Tkinter image and displays it in the Label widget
 			self.game_image_tk = ImageTk.PhotoImage(self.game_image)
@@ -361,23 +615,17 @@ class E4Mame:
 		:param event: The event object.
 		"""
 		# Gets the selected game
-		selected_game_description = self.game_list.get(tk.ACTIVE)
-		selected_game = next(
-			game
-			for game in self.games
-			if self.games[game][FLD_DESCRIPTION] == selected_game_description
-		)
+		selected_game = self.get_game_at(self.game_list.index(tk.ACTIVE))
+		if selected_game is None:
+			return
 
 		# Launches the selected game with MAME
 		try:
-			result = subprocess.run(
-				[self.config["mame_executable"], selected_game],
-				capture_output=True,
-				check=False,
-			)
+			result = run_game(self.config, selected_game)
 		except (subprocess.CalledProcessError, FileNotFoundError) as e:
 			self.error(e)
-		
+			return
+
 		if result.stderr.decode() != "":
 			error_message = (
 				_("An error occurred while running the game:")
@@ -396,14 +644,96 @@ class E4Mame:
 		self.game_list.delete(0, tk.END)
 
 		# Loads the JSON file with game information
-		with open(self.source, "r") as f:
-			self.games = json.load(f)
+		self.games = self.share_games(load_games_file(self.source, self.low_memory))
+
+		# Precomputes the facet indexes
+		self.index = FacetIndex(self.games, self.low_memory)
 
 		# Adds games to the list
-		for game in sorted(
-			self.games.keys(), key=lambda x: self.games[x][FLD_DESCRIPTION]
-		):
-			self.game_list.insert(tk.END, self.games[game][FLD_DESCRIPTION])
+		if self.search:
+			self.update_filters()
+			self.search_games()
+		else:
+			self.show_games(self.index.query(grouped=self.grouped))
+
+	def add_games(self, games):
+		"""
+		Add games to the games list while it is being built, keeping the selected game.
+
+		:param games: The dictionary of the games to add.
+		"""
+		selection = self.game_list.curselection()
+		selected_game = self.get_game_at(selection[0]) if selection else None
+		top_game = self.get_game_at(self.game_list.nearest(0))
+
+		# Updates the facet indexes with the new games only
+		updated = [game for game in games if game in self.games]
+		self.games.update(games)
+		if updated:
+			self.index = FacetIndex(self.games, self.low_memory)
+		else:
+			self.index.add(games)
+
+		# Adds the new games to the list
+		if self.search:
+			self.update_filters()
+		query = self.index.query(*self.get_query(), self.grouped)
+		if updated or self.expanded:
+			self.show_games(query)
+		else:
+			self.merge_games(query)
+
+		# Restores the selection and the scroll position
+		if top_game in self.displayed_rows:
+			self.game_list.yview(self.displayed_rows[top_game])
+		if selected_game in self.displayed_rows:
+			index = self.displayed_rows[selected_game]
+			self.game_list.selection_clear(0, tk.END)
+			self.game_list.selection_set(index)
+			self.game_list.activate(index)
+		elif selected_game is None and len(self.displayed_games) > 0:
+			self.select_first_game()
+
+	def merge_games(self, games):
+		"""
+		Display the given games in the games list, deleting and inserting only the rows that change.
+
+		:param games: The names of the games to display, in the order of the displayed ones.
+		"""
+		# Clones hidden under a parent added since
+		matched = set(games)
+		for index in range(len(self.displayed_games) - 1, -1, -1):
+			if self.displayed_games[index] not in matched:
+				self.game_list.delete(index)
+				self.remove_typeahead_keys([self.displayed_games[index]])
+				del self.displayed_games[index]
+
+		# Inserts every run of new games with a single call
+		displayed = self.displayed_games
+		index = 0
+		start = 0
+		for position, game in enumerate(games):
+			if index < len(displayed) and displayed[index] == game:
+				if start < position:
+					self.game_list.insert(start, *[self.games[new_game][FLD_DESCRIPTION] for new_game in games[start:position]])
+				index += 1
+				start = position + 1
+		if start < len(games):
+			self.game_list.insert(tk.END, *[self.games[new_game][FLD_DESCRIPTION] for new_game in games[start:]])
+		displayed = set(self.displayed_games)
+		self.add_typeahead_keys(game for game in games if game not in displayed)
+		self.displayed_games = games
+		self.update_rows()
+
+	def set_info(self, text=None):
+		"""
+		Show a text in the info label, or the default one.
+
+		:param text: The text to show, None for the default one.
+		"""
+		if text is None:
+			text = _("Double click to launch the game, right click for more options")
+		self.info_label.config(text=text)
 
 	def popup(self, event):
 		"""
@@ -412,12 +742,9 @@ class E4Mame:
 		:param event: The event object.
 		"""
 		# Modify the second voice of the menu
-		selected_game_description = self.game_list.get(tk.ACTIVE)
-		selected_game = next(
-			game
-			for game in self.games
-			if self.games[game][FLD_DESCRIPTION] == selected_game_description
-		)
+		selected_game = self.get_game_at(self.game_list.index(tk.ACTIVE))
+		if selected_game is None:
+			return
 		if selected_game in self.favorites:
 			self.menu.entryconfig(
 				1,
@@ -431,4 +758,14 @@ class E4Mame:
 				command=lambda: self.add_favorite(selected_game),
 			)
 
+		# Modify the clones voice of the menu
+		if self.grouped:
+			clones = self.index.get_clones(selected_game, *self.get_query())
+			self.menu.entryconfig(
+				2,
+				label=LBL_HIDE_CLONES if selected_game in self.expanded else LBL_SHOW_CLONES + f" ({len(clones)})",
+				command=lambda: self.toggle_clones(selected_game),
+				state=tk.NORMAL if clones else tk.DISABLED,
+			)
+
 		self.menu.tk_popup(event.x_root, event.y_root)
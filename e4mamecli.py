@@ -0,0 +1,135 @@
+#!/bin/env python3
+from i18n import _
+from config import get_config
+from const import APP_TITLE, FLD_DESCRIPTION
+from catalog import FacetIndex, FACETS, find_game, scan_games, load_favorites, save_favorites
+import argparse
+import json
+import sys
+
+def output(data):
+	"""
+	Print data as JSON on the standard output.
+
+	:param data: The data to print.
+	"""
+	if isinstance(data, list) and data:
+		# One object per line: the indenting encoder is slow on long lists, and
+		# '}, {"' cannot appear inside a string, where quotes are escaped
+		sys.stdout.write("[\n    " + json.dumps(data)[1:-1].replace('}, {"', '},\n    {"') + "\n]\n")
+		return
+	json.dump(data, sys.stdout, indent=4)
+	sys.stdout.write("\n")
+
+def fail(message):
+	"""
+	Print an error as JSON on the standard error and exit.
+
+	:param message: The error message.
+	"""
+	json.dump({"error": message}, sys.stderr)
+	sys.stderr.write("\n")
+	sys.exit(1)
+
+def parse_filters(filters):
+	"""
+	Parse the --filter arguments into a dictionary facet -> value.
+
+	:param filters: The list of FACET=VALUE strings.
+	"""
+	parsed = {}
+	for item in filters or []:
+		facet, _separator, value = item.partition("=")
+		if facet not in FACETS:
+			fail(_("Unknown filter:") + " " + facet)
+		parsed[facet] = value
+	return parsed
+
+def get_game(config, rom):
+	"""
+	Get a game by ROM name from the games index, or exit with an error.
+
+	:param config: The configuration variables
+	:param rom: The ROM name of the game.
+	"""
+	try:
+		game = find_game(config, rom)
+	except FileNotFoundError:
+		fail(_("The games file does not exist. Please run main.py first."))
+	if game is None:
+		fail(_("Unknown game:") + " " + rom)
+	return game
+
+def list_games(games):
+	"""
+	Print the given games with their descriptions.
+
+	:param games: The (name, description) of the games to print.
+	"""
+	output([{"name": name, FLD_DESCRIPTION: description} for name, description in games])
+
+if __name__ == "__main__":
+	# Parse arguments
+	parser = argparse.ArgumentParser(description=APP_TITLE + " - " + _("command line"))
+	subparsers = parser.add_subparsers(dest="command", required=True)
+
+	for name, help_text in (("list", _("List the games")), ("search", _("Search the games"))):
+		subparser = subparsers.add_parser(name, help=help_text)
+		if name == "search":
+			subparser.add_argument("query", type=str, help=_("Text contained in the description"))
+		subparser.add_argument(
+			"-f", "--filter", action="append", metavar="FACET=VALUE",
+			help=_("Filter by") + " " + ", ".join(FACETS),
+		)
+		subparser.add_argument("--grouped", action="store_true", help=_("Leave out the clones"))
+
+	subparser = subparsers.add_parser("info", help=_("Show a game"))
+	subparser.add_argument("rom", type=str)
+
+	subparser = subparsers.add_parser("launch", help=_("Launch a game"))
+	subparser.add_argument("rom", type=str)
+
+	subparser = subparsers.add_parser("favorites", help=_("List, add or remove favorites"))
+	subparser.add_argument("action", choices=("list", "add", "remove"))
+	subparser.add_argument("rom", type=str, nargs="?")
+
+	args = parser.parse_args()
+
+	config = get_config(True)
+
+	if args.command in ("list", "search"):
+		query = args.query if args.command == "search" else ""
+		try:
+			games = scan_games(config, query, parse_filters(args.filter), args.grouped)
+		except FileNotFoundError:
+			fail(_("The games file does not exist. Please run main.py first."))
+		list_games(games)
+	elif args.command == "info":
+		output({"name": args.rom, **get_game(config, args.rom)})
+	elif args.command == "launch":
+		get_game(config, args.rom)
+		# subprocess is only needed to launch a game
+		from launches import run_game
+
+		try:
+			result = run_game(config, args.rom)
+		except (FileNotFoundError, PermissionError) as e:
+			fail(str(e))
+		output({
+			"name": args.rom,
+			"returncode": result.returncode,
+			"stderr": result.stderr.decode("utf-8", "replace"),
+		})
+	elif args.command == "favorites":
+		favorites = load_favorites(config)
+		if args.action == "list":
+			list_games((name, favorites[name][FLD_DESCRIPTION]) for name in FacetIndex(favorites, low_memory=True).query())
+		else:
+			if args.rom is None:
+				fail(_("Please give the game to add or remove"))
+			if args.action == "add":
+				favorites[args.rom] = get_game(config, args.rom)
+			else:
+				favorites.pop(args.rom, None)
+			save_favorites(config, favorites)
+			output({"name": args.rom, "favorite": args.rom in favorites})
@@ -1,16 +1,18 @@
 import gettext
 import locale
+import os
 
-# Sets the default locale
-locale.setlocale(locale.LC_ALL, "")
+# The translations are next to this file, whatever the working directory
+LOCALE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "locales")
+
+# Sets the default locale, if it is installed
+try:
+	locale.setlocale(locale.LC_ALL, "")
+except locale.Error:
+	pass
 # Gets the default encoding
 encoding = locale.getencoding()
 
-# Gets the default locale
-lang, _ = locale.getlocale()
-
-if lang:
-	g = gettext.translation("base", localedir="locales")
-	_ = g.gettext
-else:
-	gettext.install(True)
+# Gets the translations of the default locale, or the original strings if there are none
+g = gettext.translation("base", localedir=LOCALE_DIR, fallback=True)
+_ = g.gettext
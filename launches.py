@@ -0,0 +1,197 @@
+from config import add_recent_game, _
+import json
+import math
+import os
+import struct
+import subprocess
+import threading
+import time
+
+# Fixed size launch record: time, ROM name, MAME version, seconds to exit,
+# exit code, stderr bytes and first error line
+RECORD = struct.Struct("<d16s32sfiI120s")
+# Number of games listed in every section of the report
+WORST_OFFENDERS = 10
+
+mame_versions = {}
+records_lock = threading.Lock()
+
+def get_mame_version(config):
+	"""
+	Get the version of the MAME executable, saved in the config directory while
+	the executable is not modified, so that MAME is not run again by every process.
+
+	:param config: The configuration variables
+	"""
+	mame_executable = config["mame_executable"]
+	try:
+		key = (mame_executable, os.path.getmtime(mame_executable))
+	except OSError:
+		key = (mame_executable, None)
+	if key in mame_versions:
+		return mame_versions[key]
+
+	try:
+		with open(config["mame_version_file"], "r") as f:
+			saved = json.load(f)
+		if (saved["mame_executable"], saved["mtime"]) == key:
+			mame_versions[key] = saved["version"]
+			return mame_versions[key]
+	except (FileNotFoundError, json.JSONDecodeError, KeyError, TypeError):
+		pass
+
+	try:
+		result = subprocess.run([mame_executable, "-version"], capture_output=True, text=True, check=False)
+		mame_versions[key] = result.stdout.strip().split(" ")[0]
+	except (FileNotFoundError, PermissionError):
+		mame_versions[key] = ""
+	try:
+		with open(config["mame_version_file"], "w") as f:
+			json.dump({"mame_executable": key[0], "mtime": key[1], "version": mame_versions[key]}, f)
+	except OSError:
+		pass
+	return mame_versions[key]
+
+def to_field(text, size):
+	"""
+	Encode a text in at most size bytes, without cutting a character.
+
+	:param text: The text to encode.
+	:param size: The size of the field.
+	"""
+	return text.encode("utf-8")[:size].decode("utf-8", "ignore").encode("utf-8")
+
+def record_launch(config, game, duration, returncode, stderr):
+	"""
+	Remember the game as recently launched and append the record of a launch to the launches file.
+
+	:param config: The configuration variables
+	:param game: The name of the game.
+	:param duration: The seconds from the launch to the exit of MAME.
+	:param returncode: The exit code of MAME.
+	:param stderr: The standard error of MAME, in bytes.
+	"""
+	lines = [line.strip() for line in stderr.decode("utf-8", "replace").splitlines() if line.strip()]
+	record = RECORD.pack(
+		time.time(),
+		to_field(game, 16),
+		to_field(get_mame_version(config), 32),
+		duration,
+		returncode,
+		len(stderr),
+		to_field(lines[0] if lines else "", 120),
+	)
+	with records_lock:
+		# Checked first when building the games list
+		add_recent_game(config, game)
+		with open(config["launches_file"], "ab") as f:
+			f.write(record)
+
+def run_game(config, game):
+	"""
+	Launch a game with MAME, wait for its exit and record the launch in background.
+
+	:param config: The configuration variables
+	:param game: The name of the game.
+	"""
+	start = time.monotonic()
+	result = subprocess.run(
+		[config["mame_executable"], game],
+		capture_output=True,
+		check=False,
+	)
+	duration = time.monotonic() - start
+
+	threading.Thread(
+		target=record_launch,
+		args=(config, game, duration, result.returncode, result.stderr),
+	).start()
+	return result
+
+def read_launches(config):
+	"""
+	Read all the launch records as dictionaries.
+
+	:param config: The configuration variables
+	"""
+	try:
+		with open(config["launches_file"], "rb") as f:
+			data = f.read()
+	except FileNotFoundError:
+		return []
+
+	# Ignores an incomplete last record
+	data = data[:len(data) - len(data) % RECORD.size]
+	return [
+		{
+			"time": launch_time,
+			"game": game.rstrip(b"\0").decode("utf-8"),
+			"version": version.rstrip(b"\0").decode("utf-8"),
+			"duration": duration,
+			"returncode": returncode,
+			"stderr_bytes": stderr_bytes,
+			"error": error.rstrip(b"\0").decode("utf-8"),
+		}
+		for launch_time, game, version, duration, returncode, stderr_bytes, error in RECORD.iter_unpack(data)
+	]
+
+def percentile(values, p):
+	"""
+	Get the p-th percentile of a list of values (nearest rank).
+
+	:param values: The values.
+	:param p: The percentile, between 0 and 100.
+	"""
+	values = sorted(values)
+	if not values:
+		return 0
+	rank = max(0, math.ceil(p / 100 * len(values)) - 1)
+	return values[rank]
+
+def print_launch_stats(config):
+	"""
+	Print the percentiles of the launches duration and the worst offenders.
+
+	:param config: The configuration variables
+	"""
+	launches = read_launches(config)
+	if not launches:
+		print(_("No launch has been recorded yet."))
+		return
+
+	durations = [launch["duration"] for launch in launches]
+	print(_("Launches:") + " " + str(len(launches)))
+	print(_("Seconds to exit:") + " " + ", ".join(
+		f"p{p} {percentile(durations, p):.1f}" for p in (50, 90, 99)
+	) + f", max {max(durations):.1f}")
+
+	games = {}
+	for launch in launches:
+		games.setdefault(launch["game"], []).append(launch)
+
+	def print_worst(title, key, fmt):
+		worst = sorted(games.items(), key=lambda item: key(item[1]), reverse=True)[:WORST_OFFENDERS]
+		worst = [(game, game_launches) for game, game_launches in worst if key(game_launches) > 0]
+		if not worst:
+			return
+		print()
+		print(title)
+		for game, game_launches in worst:
+			errors = [launch["error"] for launch in game_launches if launch["error"]]
+			print(f"  {game:<16} {fmt(key(game_launches))}  {errors[-1] if errors else ''}")
+
+	print_worst(
+		_("Slowest to exit (median seconds):"),
+		lambda game_launches: percentile([launch["duration"] for launch in game_launches], 50),
+		lambda value: f"{value:8.1f}",
+	)
+	print_worst(
+		_("Exited with an error (launches):"),
+		lambda game_launches: sum(1 for launch in game_launches if launch["returncode"] != 0),
+		lambda value: f"{value:8d}",
+	)
+	print_worst(
+		_("Most warnings (stderr bytes per launch):"),
+		lambda game_launches: sum(launch["stderr_bytes"] for launch in game_launches) // len(game_launches),
+		lambda value: f"{value:8d}",
+	)
@@ -1,14 +1,21 @@
 #!/bin/env python3
 from i18n import _
-from config import get_config, copy_config_files, build_games
+from config import get_config, copy_config_files
+from builder import build_games, get_priority_games
 from const import ALL_GAMES_FRONTEND, FAVORITES_GAMES_FRONTEND
 from e4mamemanager import E4MameManager
 from e4mame import E4Mame
+from stallwatchdog import StallWatchdog
+from launches import print_launch_stats
+from thumbnails import close_thumbnail_caches
 import argparse
+import gc
 import os
+import queue
 import subprocess
 import sys
 import json
+import threading
 import tkinter as tk
 from tkinter import messagebox
 from tkinter import ttk, font
@@ -28,6 +35,9 @@ LBL_QUIT = _("Quit")
 
 FLD_DESCRIPTION = "description"
 
+# Milliseconds between two checks of the games built in background
+BUILD_POLL_INTERVAL = 500
+
 def get_about_notebook():
 	"""
 	Build and return the about notebook tab.
@@ -59,6 +69,60 @@ def get_about_notebook():
 	label_license.pack(fill=tk.X, pady=(0, pad2))
 	return about_notebook
 
+def build_games_in_background(custom_xml=None):
+	"""
+	Build the games list in a background thread, favorites and recently
+	launched games first, putting the working games in a queue in batches.
+	A None in the queue means that the build is over.
+
+	:param custom_xml: A custom xml file instead of that one returned by mame -listxml.
+	"""
+	games_queue = queue.Queue()
+	stop = threading.Event()
+
+	def build():
+		try:
+			games = build_games(
+				config,
+				custom_xml,
+				priority=get_priority_games(get_config(True)),
+				publish=games_queue.put,
+				stop=stop,
+			)
+			if games is not None:
+				copy_config_files()
+		finally:
+			games_queue.put(None)
+
+	threading.Thread(target=build, daemon=True).start()
+	return games_queue, stop
+
+def poll_built_games(frontend, games_queue):
+	"""
+	Add the games built in background to the frontend, until the build is over.
+
+	:param frontend: The E4Mame instance of all the games.
+	:param games_queue: The queue returned by build_games_in_background.
+	"""
+	games = {}
+	finished = False
+	while True:
+		try:
+			batch = games_queue.get_nowait()
+		except queue.Empty:
+			break
+		if batch is None:
+			finished = True
+			break
+		games.update(batch)
+
+	if games:
+		frontend.add_games(games)
+	if finished:
+		frontend.set_info()
+	else:
+		frontend.window.after(BUILD_POLL_INTERVAL, poll_built_games, frontend, games_queue)
+
 
 if __name__ == "__main__":
 	# Parse arguments
@@ -67,10 +131,18 @@ if __name__ == "__main__":
 	parser.add_argument(
 		"-x", "--xml", type=str, help="Path to your MAME custom XML file"
 	)
+	parser.add_argument(
+		"--launch-stats", action="store_true", help="Show the statistics of the launched games"
+	)
 	args = parser.parse_args()
 
+	if args.launch_stats:
+		print_launch_stats(get_config(True))
+		sys.exit()
+
 	# Get the config file from the current directory
 	config = get_config(False)
+	games_queue = None
 
 	# Check if games_file exists or creates it
 	if not os.path.isfile(config["games_file"]):
@@ -87,7 +159,7 @@ if __name__ == "__main__":
 		if confirm == _("N").lower():
 			print(_("Please correct") + " " + config["config_file"])
 			sys.exit()
-		else:
+		elif args.games:
 			if args.xml is not None:
 				build_games(config, args.xml)
 			else:
@@ -95,6 +167,10 @@ if __name__ == "__main__":
 			copy_config_files()
 			print(_("All files have been update. Please restart the program"))
 			sys.exit()
+		else:
+			# Build in background and fill the list while the games are checked
+			copy_config_files()
+			games_queue, stop_build = build_games_in_background(args.xml)
 
 	# Now user_config_dir(app_name) has been created and
 	# the config files have been copied. Re-read them from there
@@ -106,6 +182,7 @@ if __name__ == "__main__":
 			build_games(config, args.xml)
 		else:
 			build_games(config)
+		copy_config_files()
 	else:
 		# Creates the main window
 		window = tk.Tk()
@@ -153,6 +230,31 @@ if __name__ == "__main__":
 		# Add the tab
 		notebook.add(get_about_notebook(), text=_("About"))
 
+		if config["low_memory"]:
+			# Frees what was left by loading the games lists before the main loop
+			gc.collect()
+
+		if games_queue is not None:
+			all_games_frontend.set_info(_("Checking your games, the list will fill in..."))
+			window.after(BUILD_POLL_INTERVAL, poll_built_games, all_games_frontend, games_queue)
+
 		window.after_idle(lambda: all_games_frontend.select_first_game())
+
+		# Watches the main loop for stalls (if stall_threshold is set), once the frontends are built
+		watchdog = None
+		if config["stall_threshold"] > 0:
+			watchdog = StallWatchdog(window, config["stall_threshold"], config["stall_log_file"])
+			watchdog.start()
+
 		# Starts the main window
 		window.mainloop()
+
+		if games_queue is not None:
+			# Stops the build, the games list will be built again on next run
+			stop_build.set()
+
+		if watchdog is not None:
+			watchdog.stop()
+
+		# Saves the thumbnails built on first view
+		close_thumbnail_caches()
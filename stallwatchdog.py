@@ -0,0 +1,145 @@
+import os
+import sys
+import threading
+import time
+import traceback
+
+# Milliseconds between two heartbeats of the Tk main loop
+HEARTBEAT_INTERVAL = 50
+# Upper bounds, in milliseconds, of the heartbeat delay histogram buckets
+HISTOGRAM_BUCKETS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+# Frames between the Tkinter callback wrapper and the handler: bindings like
+# lambda event: self.handler(...) and the after() wrapper
+WRAPPERS = ("<lambda>", "callit")
+# Handler logged when the main loop was late but no stack could be sampled
+UNKNOWN_HANDLER = "unknown"
+
+class StallWatchdog:
+	"""
+	Class that measures the responsiveness of the Tk main loop with a heartbeat
+	and logs the handlers that keep it busy for longer than a threshold.
+	"""
+
+	def __init__(self, window, threshold, log_file):
+		"""
+		Initialize the StallWatchdog class.
+
+		:param window: The main window of the application.
+		:param threshold: The stall threshold in milliseconds.
+		:param log_file: The path of the stall log file.
+		"""
+		self.window = window
+		self.threshold = threshold / 1000
+		self.log_file = log_file
+		self.main_thread_id = threading.main_thread().ident
+		self.last_beat = time.monotonic()
+		self.histogram = [0] * (len(HISTOGRAM_BUCKETS) + 1)
+		self.handlers = {}
+		self.sample = None
+		self.running = False
+		self.lock = threading.Lock()
+		self.thread = threading.Thread(target=self.monitor, daemon=True)
+
+	def start(self):
+		"""
+		Start the heartbeat and the monitoring thread.
+		"""
+		self.running = True
+		self.last_beat = time.monotonic()
+		self.window.after(HEARTBEAT_INTERVAL, self.heartbeat)
+		self.thread.start()
+
+	def stop(self):
+		"""
+		Stop the monitoring thread and write the summary in the stall log.
+		"""
+		self.running = False
+		self.thread.join()
+		self.write_summary()
+
+	def heartbeat(self):
+		"""
+		Record the delay of the heartbeat and close the stall in progress, if any.
+		"""
+		now = time.monotonic()
+		delay = now - self.last_beat - HEARTBEAT_INTERVAL / 1000
+		with self.lock:
+			sample = self.sample
+			self.sample = None
+			self.last_beat = now
+
+		delay_ms = max(0, delay * 1000)
+		bucket = next(
+			(i for i, bound in enumerate(HISTOGRAM_BUCKETS) if delay_ms < bound),
+			len(HISTOGRAM_BUCKETS),
+		)
+		self.histogram[bucket] += 1
+
+		if sample is not None:
+			self.log_stall(delay_ms, *sample)
+		elif delay_ms >= self.threshold * 1000:
+			# Shorter than the sampling period, or spent outside of the Python code
+			self.log_stall(delay_ms, UNKNOWN_HANDLER, "")
+
+		if self.running:
+			self.window.after(HEARTBEAT_INTERVAL, self.heartbeat)
+
+	def monitor(self):
+		"""
+		Sample the stack of the main thread when the heartbeat is late.
+		"""
+		while self.running:
+			time.sleep(self.threshold / 2)
+			with self.lock:
+				late = time.monotonic() - self.last_beat - HEARTBEAT_INTERVAL / 1000
+				if late < self.threshold or self.sample is not None:
+					continue
+				frame = sys._current_frames().get(self.main_thread_id)
+				if frame is None:
+					continue
+				self.sample = self.get_handler(traceback.extract_stack(frame))
+
+	def get_handler(self, stack):
+		"""
+		Get the name of the handler running in a stack of the main thread, and the stack itself.
+
+		:param stack: The traceback.StackSummary of the main thread.
+		"""
+		# The handler is the frame called by the Tkinter callback wrapper
+		handler = None
+		for i, frame in enumerate(stack[:-1]):
+			if frame.name == "__call__" and os.path.basename(os.path.dirname(frame.filename)) == "tkinter":
+				j = i + 1
+				while stack[j].name in WRAPPERS and j + 1 < len(stack):
+					j += 1
+				handler = stack[j].name
+		if handler is None:
+			handler = stack[-1].name
+		frames = "; ".join(f"{os.path.basename(frame.filename)}:{frame.lineno} {frame.name}" for frame in stack)
+		return handler, frames
+
+	def log_stall(self, duration, handler, frames):
+		"""
+		Record a stall and append it to the stall log.
+
+		:param duration: The duration of the stall in milliseconds.
+		:param handler: The name of the handler that caused the stall.
+		:param frames: The sampled stack of the main thread.
+		"""
+		count, longest = self.handlers.get(handler, (0, 0))
+		self.handlers[handler] = (count + 1, max(longest, duration))
+		with open(self.log_file, "a") as f:
+			f.write(f"{time.strftime('%Y-%m-%d %H:%M:%S')}\t{duration:.0f} ms\t{handler}\t{frames}\n")
+
+	def write_summary(self):
+		"""
+		Append the heartbeat delay histogram and the stalls per handler to the stall log.
+		"""
+		bounds = [f"< {bound} ms" for bound in HISTOGRAM_BUCKETS] + [f">= {HISTOGRAM_BUCKETS[-1]} ms"]
+		with open(self.log_file, "a") as f:
+			f.write(f"# {time.strftime('%Y-%m-%d %H:%M:%S')} summary, heartbeat delay histogram\n")
+			for bound, count in zip(bounds, self.histogram):
+				f.write(f"#\t{bound}\t{count}\n")
+			f.write("# stalls per handler (count, longest)\n")
+			for handler, (count, longest) in sorted(self.handlers.items(), key=lambda item: -item[1][1]):
+				f.write(f"#\t{handler}\t{count}\t{longest:.0f} ms\n")
@@ -0,0 +1,241 @@
+import json
+import os
+import random
+from array import array
+
+import pytest
+
+from const import FLD_DESCRIPTION, FLD_YEAR, FLD_MANUFACTURER, FLD_PLAYERS, FLD_ORIENTATION, FLD_CONTROL, FLD_CLONEOF, FACET_PARENT_CLONE, VAL_PARENT, VAL_CLONE
+from catalog import FacetIndex, FACETS, SPARSE_RATIO, to_bitset, from_bitset, find_game, scan_games
+
+GAMES = 2000
+# Games added to an index in every batch
+BATCH_SIZE = 150
+
+def make_games(n, seed=0):
+	"""
+	Build a random games dictionary, with repeated descriptions, common and rare
+	facet values and clones of games that are not in the dictionary.
+
+	:param n: The number of games.
+	:param seed: The seed of the random generator.
+	"""
+	generator = random.Random(seed)
+	games = {}
+	for i in range(n):
+		name = f"game{i}"
+		games[name] = {
+			FLD_DESCRIPTION: generator.choice(("The ", "the ", "Super ", "", "Ünder ")) + f"Game {generator.randint(0, n // 3)}",
+			FLD_YEAR: str(1980 + generator.randint(0, 20)),
+			# Capcom matches many games, the numbered manufacturers only a few
+			FLD_MANUFACTURER: "Capcom" if generator.random() < 0.5 else f"Maker {generator.randint(0, 200)}",
+			FLD_PLAYERS: str(generator.randint(1, 4)),
+			FLD_ORIENTATION: generator.choice(("horizontal", "vertical")),
+			FLD_CONTROL: generator.choice(("joy", "stick", "dial", "")),
+			FLD_CLONEOF: "",
+		}
+	for i in range(n):
+		if generator.random() < 0.4:
+			# Some parents are not in the dictionary
+			games[f"game{i}"][FLD_CLONEOF] = f"game{generator.randint(0, n + n // 10)}"
+	return games
+
+def brute_query(games, text="", filters=None, grouped=False):
+	"""
+	Get the names of the games matching a query by checking every game.
+
+	:param games: The games dictionary.
+	:param text: The text that the description must contain (case insensitive).
+	:param filters: A dictionary facet -> value; empty values are ignored.
+	:param grouped: If True, leave out the clones whose parent is in the list.
+	"""
+	names = sorted(games, key=lambda x: games[x][FLD_DESCRIPTION])
+	matched = []
+	for name in names:
+		game = games[name]
+		if text.lower() not in game[FLD_DESCRIPTION].lower():
+			continue
+		values = dict(game)
+		values[FACET_PARENT_CLONE] = VAL_CLONE if game[FLD_CLONEOF] else VAL_PARENT
+		if all(values[facet] == value for facet, value in (filters or {}).items() if value):
+			matched.append(name)
+	if grouped:
+		matched_set = set(matched)
+		matched = [name for name in matched if games[name][FLD_CLONEOF] not in matched_set]
+	return matched
+
+QUERIES = [
+	("", {}),
+	("game 1", {}),
+	("GAME 12", {}),
+	("ü", {}),
+	("no such game", {}),
+	("", {FLD_YEAR: "1990"}),
+	("", {FLD_MANUFACTURER: "Capcom"}),
+	("", {FLD_MANUFACTURER: "Maker 7"}),
+	("", {FLD_MANUFACTURER: "Nobody"}),
+	("", {FLD_CONTROL: ""}),
+	("", {FACET_PARENT_CLONE: VAL_CLONE}),
+	("", {FACET_PARENT_CLONE: VAL_PARENT, FLD_PLAYERS: "2"}),
+	("super", {FLD_MANUFACTURER: "Capcom", FLD_ORIENTATION: "vertical"}),
+	("the", {FLD_MANUFACTURER: "Maker 7", FLD_YEAR: "1985"}),
+]
+
+@pytest.mark.parametrize("low_memory", (False, True))
+@pytest.mark.parametrize("grouped", (False, True))
+@pytest.mark.parametrize("text, filters", QUERIES)
+def test_query_matches_brute_force(text, filters, grouped, low_memory):
+	games = make_games(GAMES)
+	index = FacetIndex(games, low_memory)
+	assert index.query(text, filters, grouped) == brute_query(games, text, filters, grouped)
+
+def test_bitsets_and_arrays():
+	games = make_games(GAMES)
+	index = FacetIndex(games)
+	for facet in FACETS:
+		for value, positions in index.get_bitsets(facet).items():
+			expected = [position for position, name in enumerate(index.names) if brute_query({name: games[name]}, "", {facet: value})]
+			if len(expected) * SPARSE_RATIO < GAMES:
+				assert isinstance(positions, array)
+				assert list(positions) == expected
+			else:
+				assert isinstance(positions, int)
+				assert from_bitset(positions) == expected
+	assert isinstance(index.get_bitsets(FLD_MANUFACTURER)["Capcom"], int)
+	assert isinstance(index.get_bitsets(FLD_MANUFACTURER)["Maker 7"], array)
+
+def test_to_bitset_from_bitset():
+	positions = [0, 3, 8, 63, 64, 199]
+	assert from_bitset(to_bitset(positions, 200)) == positions
+	assert from_bitset(to_bitset([], 200)) == []
+
+def test_values():
+	games = make_games(GAMES)
+	index = FacetIndex(games)
+	assert index.values(FACET_PARENT_CLONE) == [VAL_CLONE, VAL_PARENT]
+	assert index.values(FLD_CONTROL) == ["dial", "joy", "stick"]
+	assert index.values(FLD_YEAR) == sorted({game[FLD_YEAR] for game in games.values()})
+
+def test_get_clones():
+	games = make_games(GAMES)
+	index = FacetIndex(games)
+	for parent in index.names[:200]:
+		clones = brute_query({name: game for name, game in games.items() if game[FLD_CLONEOF] == parent})
+		assert index.get_clones(parent) == clones
+		assert index.get_clones(parent, "super", {FLD_MANUFACTURER: "Capcom"}) == brute_query(
+			{name: games[name] for name in clones}, "super", {FLD_MANUFACTURER: "Capcom"}
+		)
+
+@pytest.mark.parametrize("grouped", (False, True))
+def test_add_matches_fresh_index(grouped):
+	all_games = make_games(GAMES, seed=1)
+	names = list(all_games)
+	random.Random(2).shuffle(names)
+
+	games = {}
+	index = FacetIndex(games)
+	for start in range(0, len(names), BATCH_SIZE):
+		batch = {name: all_games[name] for name in names[start:start + BATCH_SIZE]}
+		games.update(batch)
+		index.add(batch)
+		# Uses the lazy structures between batches, so that add() has to update them
+		if start % (2 * BATCH_SIZE) == 0:
+			index.query("game", {FLD_MANUFACTURER: "Capcom"}, grouped)
+			index.values(FLD_YEAR)
+
+		fresh = FacetIndex(games)
+		assert index.names == fresh.names
+		assert index.descriptions == fresh.descriptions
+		assert index.folded == fresh.folded
+		assert index.get_clone_lists() == fresh.get_clone_lists()
+		assert index.values(FLD_YEAR) == fresh.values(FLD_YEAR)
+		for text, filters in QUERIES:
+			assert index.query(text, filters, grouped) == fresh.query(text, filters, grouped)
+
+def test_add_orphaned_clones():
+	games = {
+		"clone1": {FLD_DESCRIPTION: "B clone", FLD_CLONEOF: "parent"},
+		"clone2": {FLD_DESCRIPTION: "A clone", FLD_CLONEOF: "parent"},
+	}
+	index = FacetIndex(games)
+	assert index.get_clone_lists() == {}
+	assert index.query(grouped=True) == ["clone2", "clone1"]
+
+	batch = {"parent": {FLD_DESCRIPTION: "C parent", FLD_CLONEOF: ""}}
+	games.update(batch)
+	index.add(batch)
+	assert index.get_clones("parent") == ["clone2", "clone1"]
+	assert index.query(grouped=True) == ["parent"]
+	assert index.query("clone", grouped=True) == ["clone2", "clone1"]
+
+def make_config(path, games):
+	"""
+	Write a games file and get the configuration variables of its index and catalog.
+
+	:param path: The directory of the files.
+	:param games: The games dictionary.
+	"""
+	config = {
+		"games_file": path / "games.json",
+		"games_index_file": path / "games.idx",
+		"games_catalog_file": path / "games.tsv",
+	}
+	with open(config["games_file"], "w") as f:
+		json.dump(games, f, indent=4)
+	return config
+
+def test_find_game(tmp_path):
+	games = make_games(GAMES)
+	for name in ("äpfel", "zoë", "日本", "a", "zzzz"):
+		games[name] = {FLD_DESCRIPTION: name.upper(), FLD_CLONEOF: ""}
+	config = make_config(tmp_path, games)
+
+	names = sorted(games, key=lambda x: x.encode("utf-8"))
+	for name in [names[0], names[-1], names[len(names) // 2], "äpfel", "zoë", "日本"] + names[::97]:
+		assert find_game(config, name) == games[name]
+	for name in ("", "0", "game", "game1x", "zzzzz", "äp", "日", "~"):
+		assert find_game(config, name) is None
+
+def test_find_game_empty_catalog(tmp_path):
+	config = make_config(tmp_path, {})
+	assert find_game(config, "pacman") is None
+	assert scan_games(config) == []
+
+def test_find_game_single_game(tmp_path):
+	config = make_config(tmp_path, {"pacman": {FLD_DESCRIPTION: "Pac-Man"}})
+	assert find_game(config, "pacman") == {FLD_DESCRIPTION: "Pac-Man"}
+	assert find_game(config, "pacma") is None
+	assert find_game(config, "pacmanx") is None
+
+def test_games_files_written_again(tmp_path):
+	config = make_config(tmp_path, {"pacman": {FLD_DESCRIPTION: "Pac-Man"}})
+	assert find_game(config, "pacman") == {FLD_DESCRIPTION: "Pac-Man"}
+	assert scan_games(config) == [("pacman", "Pac-Man")]
+
+	# A games file built again after the index and the catalog
+	make_config(tmp_path, {"galaga": {FLD_DESCRIPTION: "Galaga"}})
+	index_time = os.path.getmtime(config["games_index_file"])
+	os.utime(config["games_file"], (index_time + 10, index_time + 10))
+	assert find_game(config, "pacman") is None
+	assert find_game(config, "galaga") == {FLD_DESCRIPTION: "Galaga"}
+	assert scan_games(config) == [("galaga", "Galaga")]
+
+	# Not written again while they are newer than the games file
+	make_config(tmp_path, {})
+	os.utime(config["games_file"], (index_time, index_time))
+	assert find_game(config, "galaga") == {FLD_DESCRIPTION: "Galaga"}
+	assert scan_games(config) == [("galaga", "Galaga")]
+
+def test_find_game_missing_games_file(tmp_path):
+	config = make_config(tmp_path, {})
+	os.remove(config["games_file"])
+	with pytest.raises(FileNotFoundError):
+		find_game(config, "pacman")
+
+@pytest.mark.parametrize("grouped", (False, True))
+@pytest.mark.parametrize("text, filters", QUERIES)
+def test_scan_games_matches_query(tmp_path, text, filters, grouped):
+	games = make_games(GAMES)
+	config = make_config(tmp_path, games)
+	names = FacetIndex(games).query(text, filters, grouped)
+	assert scan_games(config, text, filters, grouped) == [(name, games[name][FLD_DESCRIPTION]) for name in names]
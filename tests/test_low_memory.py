@@ -0,0 +1,142 @@
+import gc
+import io
+import json
+import tracemalloc
+import xml.etree.ElementTree as ET
+
+from const import FLD_DESCRIPTION, FLD_YEAR, FLD_MANUFACTURER, FLD_PLAYERS, FLD_ORIENTATION, FLD_CONTROL, FLD_CLONEOF, ORIENTATION_HORIZONTAL, ORIENTATION_VERTICAL
+from config import load_games_file
+from catalog import FacetIndex
+from builder import get_machine_facets, is_good_machine, iter_machines
+
+# Number of games of a full MAME catalog, more or less
+GAMES = 50000
+# Peak bytes traced while loading and indexing GAMES games in low memory mode,
+# measured at about 42 MB: a guard against regressions, the peak is mostly json.load
+LOW_MEMORY_BUDGET = 46 * 1024 * 1024
+# Bytes kept after loading and indexing in low memory mode, at most this part of
+# those kept without it (measured at about 27 MB against 39 MB)
+LOW_MEMORY_KEPT_RATIO = 0.8
+
+MANUFACTURERS = ("Capcom", "Konami", "Namco", "Sega", "Taito", "Data East", "Irem", "SNK", "Atari", "Williams")
+CONTROLS = ("joy", "stick", "paddle", "dial", "trackball", "lightgun", "pedal", "")
+
+def make_games(n):
+	"""
+	Build a games dictionary like the one of the games file.
+
+	:param n: The number of games.
+	"""
+	games = {}
+	for i in range(n):
+		name = f"game{i:05d}"
+		games[name] = {
+			FLD_DESCRIPTION: f"Game number {i} ({MANUFACTURERS[i % len(MANUFACTURERS)]}, set {i % 7})",
+			"snapshot": i % 3 != 0,
+			FLD_YEAR: str(1975 + i % 35),
+			FLD_MANUFACTURER: MANUFACTURERS[i % len(MANUFACTURERS)],
+			FLD_PLAYERS: str(1 + i % 4),
+			FLD_ORIENTATION: ORIENTATION_VERTICAL if i % 4 == 0 else ORIENTATION_HORIZONTAL,
+			FLD_CONTROL: CONTROLS[i % len(CONTROLS)],
+			# One game in four is a clone of the game before it
+			FLD_CLONEOF: f"game{i - 1:05d}" if i % 4 == 3 else "",
+		}
+	return games
+
+def measure(games_file, low_memory):
+	"""
+	Load and index a games file, returning the bytes kept and the peak bytes traced.
+
+	:param games_file: The path of the games file.
+	:param low_memory: If True, use the low memory mode.
+	"""
+	gc.collect()
+	tracemalloc.start()
+	try:
+		games = load_games_file(games_file, low_memory=low_memory)
+		index = FacetIndex(games, low_memory=low_memory)
+		index.query("number 1", {FLD_YEAR: "1980"}, grouped=True)
+		gc.collect()
+		kept, peak = tracemalloc.get_traced_memory()
+	finally:
+		tracemalloc.stop()
+	assert len(index.names) == GAMES
+	return kept, peak
+
+def test_low_memory_peak(tmp_path):
+	games_file = tmp_path / "games.json"
+	with open(games_file, "w") as f:
+		json.dump(make_games(GAMES), f)
+
+	kept, peak = measure(games_file, low_memory=True)
+	normal_kept, normal_peak = measure(games_file, low_memory=False)
+
+	assert peak < LOW_MEMORY_BUDGET, f"{peak / 1024 / 1024:.1f} MB"
+	assert peak <= normal_peak
+	assert kept < normal_kept * LOW_MEMORY_KEPT_RATIO, f"{kept / 1024 / 1024:.1f} MB, {normal_kept / 1024 / 1024:.1f} MB without low memory mode"
+
+LISTXML = b"""<?xml version="1.0"?>
+<mame build="0.265">
+	<machine name="puckman" sourcefile="pacman.cpp">
+		<description>PuckMan (Japan set 1)</description>
+		<year>1980</year>
+		<manufacturer>Namco</manufacturer>
+		<display type="raster" rotate="90"/>
+		<input players="2"><control type="joy" ways="4"/></input>
+		<driver status="good" emulation="good"/>
+	</machine>
+	<machine name="pacman" sourcefile="pacman.cpp" cloneof="puckman" romof="puckman">
+		<description>Pac-Man (Midway)</description>
+		<year>1980</year>
+		<manufacturer>Namco (Midway license)</manufacturer>
+		<display type="raster" rotate="90"/>
+		<input players="2"><control type="joy" ways="4"/></input>
+		<driver status="good" emulation="good"/>
+	</machine>
+	<machine name="neogeo" sourcefile="neogeo.cpp" isbios="yes">
+		<description>Neo-Geo</description>
+		<year>1990</year>
+		<manufacturer>SNK</manufacturer>
+		<driver status="good" emulation="good"/>
+	</machine>
+	<machine name="brokengm" sourcefile="broken.cpp">
+		<description>Broken game</description>
+		<year>199?</year>
+		<manufacturer>&lt;unknown&gt;</manufacturer>
+		<driver status="preliminary" emulation="preliminary"/>
+	</machine>
+	<machine name="sf2" sourcefile="cps1.cpp">
+		<description>Street Fighter II</description>
+		<year>1991</year>
+		<manufacturer>Capcom</manufacturer>
+		<display type="raster" rotate="0"/>
+		<input players="2" buttons="6"><control type="joy" ways="8"/></input>
+		<driver status="good" emulation="good"/>
+	</machine>
+	<machine name="nodisp" sourcefile="misc.cpp">
+		<description>No display</description>
+		<year>1985</year>
+		<manufacturer>Sega</manufacturer>
+		<driver status="good" emulation="good"/>
+	</machine>
+</mame>
+"""
+
+def test_iter_machines_facets():
+	root = ET.fromstring(LISTXML)
+	expected = {
+		machine.attrib["name"]: get_machine_facets(machine)
+		for machine in root.findall("machine")
+		if is_good_machine(machine)
+	}
+	facets = {
+		machine.attrib["name"]: get_machine_facets(machine)
+		for machine in iter_machines(io.BytesIO(LISTXML))
+		if is_good_machine(machine)
+	}
+	assert facets == expected
+	assert list(facets) == ["puckman", "pacman", "sf2", "nodisp"]
+	assert facets["pacman"][FLD_CLONEOF] == "puckman"
+	assert facets["puckman"][FLD_ORIENTATION] == ORIENTATION_VERTICAL
+	assert facets["sf2"][FLD_ORIENTATION] == ORIENTATION_HORIZONTAL
+	assert facets["nodisp"][FLD_PLAYERS] == ""
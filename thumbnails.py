@@ -0,0 +1,276 @@
+from i18n import _
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import io
+import os
+import zipfile
+from PIL import Image
+
+# Number of snapshots read from the snap file and scaled at the same time
+BATCH_SIZE = 256
+# Number of thumbnails built on first view kept in memory until they are saved
+PENDING_LIMIT = 256
+LOW_MEMORY_PENDING_LIMIT = 16
+# The thumbnails file is compacted when stale thumbnails take more than 1 / STALE_RATIO of it
+STALE_RATIO = 4
+
+thumbnail_caches = {}
+
+def get_thumbnail_name(game, height, crc):
+	"""
+	Get the name of a thumbnail in the thumbnails file.
+
+	:param game: The name of the game.
+	:param height: The height of the thumbnail.
+	:param crc: The CRC of the snapshot in the snap file.
+	"""
+	return f"{height}/{game}.{crc:08x}.png"
+
+def get_thumbnail_key(name):
+	"""
+	Get the (height, game) of a thumbnail from its name in the thumbnails file.
+
+	:param name: The name of the thumbnail.
+	"""
+	height, _separator, file_name = name.partition("/")
+	return int(height), file_name.rsplit(".", 2)[0]
+
+def scale_snapshot(img_data, height):
+	"""
+	Scale a snapshot to the given height, keeping its ratio, and return it as PNG data.
+
+	:param img_data: The PNG data of the snapshot.
+	:param height: The height of the scaled snapshot.
+	"""
+	image = Image.open(io.BytesIO(img_data))
+	width = max(1, int(image.width * height / image.height))
+	image = image.resize((width, height), Image.LANCZOS)
+	output = io.BytesIO()
+	image.save(output, "PNG")
+	return output.getvalue()
+
+def scale_snapshots(img_data, heights):
+	"""
+	Scale a snapshot to all the given heights.
+
+	:param img_data: The PNG data of the snapshot.
+	:param heights: The heights of the scaled snapshots.
+	"""
+	return {height: scale_snapshot(img_data, height) for height in heights}
+
+def build_thumbnails(games, config):
+	"""
+	Build the thumbnails file with the snapshots of the games scaled to the configured heights.
+
+	:param games: The games dictionary.
+	:param config: The configuration variables
+	"""
+	games_list = [game for game in games if games[game]["snapshot"]]
+	i = 1
+	n = len(games_list)
+
+	with zipfile.ZipFile(config["snap_file"], "r") as snaps, zipfile.ZipFile(
+		config["thumbnails_file"], "w"
+	) as pack, ProcessPoolExecutor() as executor:
+		for start in range(0, n, BATCH_SIZE):
+			futures = {}
+			for game in games_list[start:start + BATCH_SIZE]:
+				info = snaps.getinfo(f"{game}.png")
+				future = executor.submit(scale_snapshots, snaps.read(info), config["thumbnail_heights"])
+				futures[future] = (game, info.CRC)
+
+			for future in as_completed(futures):
+				game, crc = futures[future]
+				for height, img_data in future.result().items():
+					pack.writestr(get_thumbnail_name(game, height, crc), img_data)
+				print(_("Building the thumbnails for the following game: n.") + " " + str(i) + " / " + str(n) + ", " + game + "...")
+				i += 1
+
+def get_thumbnail_cache(config):
+	"""
+	Get the thumbnail cache shared by all the frontends using the same thumbnails file.
+
+	:param config: The configuration variables
+	"""
+	path = str(config["thumbnails_file"])
+	if path not in thumbnail_caches:
+		thumbnail_caches[path] = ThumbnailCache(config)
+	return thumbnail_caches[path]
+
+def close_thumbnail_caches():
+	"""
+	Close all the thumbnail caches, saving the thumbnails built on first view.
+	"""
+	for cache in thumbnail_caches.values():
+		cache.close()
+	thumbnail_caches.clear()
+
+class ThumbnailCache:
+	"""
+	Class that reads the pre-scaled snapshots from the thumbnails file, building
+	the missing or stale ones on first view and saving them when closed.
+	"""
+
+	def __init__(self, config):
+		"""
+		Initialize the ThumbnailCache class.
+
+		:param config: The configuration variables
+		"""
+		self.snap_file = config["snap_file"]
+		self.thumbnails_file = str(config["thumbnails_file"])
+		self.heights = sorted(config["thumbnail_heights"])
+		# In low memory mode the zip files are opened again on every view
+		# and fewer thumbnails built on first view are kept until saved
+		self.low_memory = config["low_memory"]
+		self.pending_limit = LOW_MEMORY_PENDING_LIMIT if self.low_memory else PENDING_LIMIT
+		# Opened on first view and kept open, reading a zip directory is slow
+		self.snaps = None
+		self.pack = None
+		# (height, game) -> name of its current thumbnail
+		self.entries = None
+		# Thumbnails built on first view, not in the thumbnails file yet
+		self.pending = {}
+
+	def open(self):
+		"""
+		Open the snap file and the thumbnails file, if not open yet.
+		"""
+		if self.snaps is None:
+			self.snaps = zipfile.ZipFile(self.snap_file, "r")
+		if self.entries is not None:
+			return
+
+		self.entries = {}
+		try:
+			self.pack = zipfile.ZipFile(self.thumbnails_file, "r")
+		except (FileNotFoundError, zipfile.BadZipFile):
+			# Built again on first view
+			self.pack = None
+			return
+		for name in self.pack.namelist():
+			self.entries[get_thumbnail_key(name)] = name
+
+	def get_height(self, height):
+		"""
+		Get the largest configured height not above the given height, or None.
+
+		:param height: The available height.
+		"""
+		heights = [cache_height for cache_height in self.heights if cache_height <= height]
+		return heights[-1] if heights else None
+
+	def read(self, name):
+		"""
+		Get the PNG data of a thumbnail from the thumbnails file, or None if it is not there.
+
+		:param name: The name of the thumbnail.
+		"""
+		if self.low_memory:
+			try:
+				with zipfile.ZipFile(self.thumbnails_file, "r") as pack:
+					return pack.read(name)
+			except (FileNotFoundError, zipfile.BadZipFile, KeyError):
+				return None
+
+		self.open()
+		if self.entries.get(get_thumbnail_key(name)) == name:
+			return self.pack.read(name)
+		return None
+
+	def get(self, game, height):
+		"""
+		Get the PNG data of the snapshot of a game scaled to get_height(height), or None.
+
+		:param game: The name of the game.
+		:param height: The available height.
+		"""
+		cache_height = self.get_height(height)
+		if cache_height is None:
+			return None
+
+		snap_name = f"{game}.png"
+		if self.low_memory:
+			with zipfile.ZipFile(self.snap_file, "r") as snaps:
+				crc = snaps.getinfo(snap_name).CRC
+		else:
+			self.open()
+			crc = self.snaps.getinfo(snap_name).CRC
+		name = get_thumbnail_name(game, cache_height, crc)
+		if name in self.pending:
+			return self.pending[name]
+
+		img_data = self.read(name)
+		if img_data is not None:
+			return img_data
+
+		# Missing, or the snapshot has changed: scale it again
+		if self.low_memory:
+			with zipfile.ZipFile(self.snap_file, "r") as snaps:
+				img_data = scale_snapshot(snaps.read(snap_name), cache_height)
+		else:
+			img_data = scale_snapshot(self.snaps.read(snap_name), cache_height)
+		if len(self.pending) < self.pending_limit:
+			self.pending[name] = img_data
+			if self.entries is not None:
+				self.entries[(cache_height, game)] = name
+		return img_data
+
+	def close(self):
+		"""
+		Close the files and save the thumbnails built on first view.
+		"""
+		if self.snaps is not None:
+			self.snaps.close()
+			self.snaps = None
+		if self.pack is not None:
+			self.pack.close()
+			self.pack = None
+		self.entries = None
+		self.save()
+		self.pending = {}
+
+	def save(self):
+		"""
+		Add the thumbnails built on first view to the thumbnails file as it is now
+		on disk, which may have been built again meanwhile. The thumbnails file is
+		written again without the stale thumbnails once they take too much of it.
+		"""
+		try:
+			pack = zipfile.ZipFile(self.thumbnails_file, "r")
+		except (FileNotFoundError, zipfile.BadZipFile):
+			if self.pending:
+				with zipfile.ZipFile(self.thumbnails_file, "w") as pack:
+					for name, img_data in self.pending.items():
+						pack.writestr(name, img_data)
+			return
+
+		with pack:
+			infos = pack.infolist()
+			names = {info.filename for info in infos}
+			new = {name: img_data for name, img_data in self.pending.items() if name not in names}
+
+			# The last thumbnail of every game and height is the current one
+			current = {}
+			for name in [info.filename for info in infos] + list(new):
+				current[get_thumbnail_key(name)] = name
+			current = set(current.values())
+			stale_size = sum(info.compress_size for info in infos if info.filename not in current)
+			total_size = sum(info.compress_size for info in infos)
+
+			compact = stale_size * STALE_RATIO > total_size
+			if compact:
+				temporary_file = self.thumbnails_file + ".tmp"
+				with zipfile.ZipFile(temporary_file, "w") as compacted:
+					for info in infos:
+						if info.filename in current:
+							compacted.writestr(info, pack.read(info))
+					for name, img_data in new.items():
+						compacted.writestr(name, img_data)
+
+		if compact:
+			os.replace(temporary_file, self.thumbnails_file)
+		elif new:
+			# A single rewrite of the zip directory for the whole session
+			with zipfile.ZipFile(self.thumbnails_file, "a") as pack:
+				for name, img_data in new.items():
+					pack.writestr(name, img_data)